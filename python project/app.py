@@ -1,22 +1,243 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response, abort, g, has_app_context, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
+import click
+from sqlalchemy import and_, event, func, inspect, literal, or_, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import OperationalError
 from datetime import datetime
 import os
+import csv
+import io
+import json
+import hashlib
 from datetime import timedelta
+from bisect import bisect_left, bisect_right, insort
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import sqlite3
+import threading
+import time
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your_secret_key'
 
-# Create a doctor database binding
+# Doctors and patients are separate binds. By default each is a SQLite file
+# in HOSPITAL_DATA_DIR (the app directory unless set, e.g. for benchmarks).
+# DATABASE_URL points both at one server database; DOCTORS_DATABASE_URL and
+# PATIENTS_DATABASE_URL override a single bind. 'sqlite://' is in-memory.
+DATA_DIR = os.environ.get('HOSPITAL_DATA_DIR', app.root_path)
+
+def database_url(bind, filename):
+    return (os.environ.get(f'{bind.upper()}_DATABASE_URL') or os.environ.get('DATABASE_URL')
+            or 'sqlite:///' + os.path.join(DATA_DIR, filename))
+
 app.config['SQLALCHEMY_BINDS'] = {
-    'doctors': 'sqlite:///doctors.db',
-    'default': 'sqlite:///patients.db'
+    'doctors': database_url('doctors', 'doctors.db'),
+    'default': database_url('patients', 'patients.db')
 }
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
+app.config['PATIENTS_PAGE_SIZE'] = 50
+app.config['STATS_CACHE_TTL'] = 300  # seconds before dashboard counters are rebuilt
+app.config['BOOKING_RETRIES'] = 5  # attempts when the database is locked by another writer
+app.config['SQLITE_BUSY_TIMEOUT'] = 5000  # ms a connection waits for a lock before failing
+app.config['IMPORT_BATCH_SIZE'] = 2000  # rows per transaction in bulk imports
+app.config['IMPORT_MAX_ERRORS'] = 1000  # per-row errors kept in an import report
+app.config['EXPORT_CHUNK_SIZE'] = 1000  # rows fetched and written per chunk in exports
+app.config['PATIENT_DETAIL_WINDOW'] = 50  # history/appointment rows shown before "load more"
+app.config['REQUEST_QUERY_BUDGET'] = 20  # log a warning when a request issues more SQL queries than this
+app.config['SUGGESTION_WORKERS'] = 4  # threads computing alternatives for failed bookings
+app.config['DEFAULT_SLOT_MINUTES'] = 30  # appointment length for doctors without their own
+app.config['CALENDAR_CACHE_DAYS'] = 20000  # compiled doctor-days kept before the slot table is rebuilt
+app.config['APPOINTMENT_RETENTION_DAYS'] = 365  # completed/cancelled visits older than this are archived
+app.config['ARCHIVE_BATCH_SIZE'] = 5000  # appointments moved per archival transaction
+app.config['DB_POOL_SIZE'] = 5  # connections kept open per bind and worker
+app.config['DB_MAX_OVERFLOW'] = 10  # extra connections allowed under bursts
+app.config['DB_POOL_TIMEOUT'] = 30  # seconds to wait for a free connection
+app.config['DB_POOL_RECYCLE'] = 1800  # seconds before a server connection is replaced
+app.config['DB_POOL_PRE_PING'] = True  # test connections on checkout so dropped ones are replaced
+app.config['DB_CONNECT_TIMEOUT'] = 10  # seconds to reach a database server
+app.config['SQLITE_SYNCHRONOUS'] = 'NORMAL'  # durable across app crashes in WAL mode, fsyncs only on checkpoint
+app.config['SQLITE_MMAP_SIZE'] = 128 * 1024 * 1024  # bytes of each database file read through mmap
+app.config['SQLITE_CACHE_SIZE'] = -16384  # page cache per connection; negative is KiB
+# Any of the above can be overridden from a settings file
+app.config.from_envvar('HOSPITAL_SETTINGS', silent=True)
+# Doctor cache shared by the workers on this host that use the same doctors
+# database; set to None to keep it per process
+DOCTORS_URL = app.config['SQLALCHEMY_BINDS']['doctors']
+if DOCTORS_URL in ('sqlite://', 'sqlite:///:memory:'):
+    # An in-memory database is private to this process, so the doctor cache must be too
+    app.config.setdefault('DOCTOR_DIRECTORY_SNAPSHOT', None)
+else:
+    app.config.setdefault('DOCTOR_DIRECTORY_SNAPSHOT', os.path.join(
+        DATA_DIR, f"doctor_directory-{hashlib.sha1(DOCTORS_URL.encode()).hexdigest()[:12]}.json"))
+
+def is_sqlite(engine_or_connection):
+    return engine_or_connection.dialect.name == 'sqlite'
+
+class PooledSQLAlchemy(SQLAlchemy):
+    """Builds every bind's engine from the DB_* settings for its backend."""
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        if sa_url.get_backend_name() != 'sqlite':
+            options.update(
+                pool_pre_ping=app.config['DB_POOL_PRE_PING'],
+                pool_size=app.config['DB_POOL_SIZE'],
+                max_overflow=app.config['DB_MAX_OVERFLOW'],
+                pool_timeout=app.config['DB_POOL_TIMEOUT'],
+                pool_recycle=app.config['DB_POOL_RECYCLE'],
+            )
+            if sa_url.get_backend_name() == 'postgresql':
+                options.setdefault('connect_args', {})['connect_timeout'] = app.config['DB_CONNECT_TIMEOUT']
+        elif sa_url.database not in (None, '', ':memory:'):
+            # Reuse file connections (and the pragmas set on them) instead of
+            # reopening the file per session; in-memory databases keep the
+            # single shared connection Flask-SQLAlchemy gives them
+            options.update(
+                poolclass=QueuePool,
+                pool_size=app.config['DB_POOL_SIZE'],
+                max_overflow=app.config['DB_MAX_OVERFLOW'],
+                pool_timeout=app.config['DB_POOL_TIMEOUT'],
+            )
+            # Pooled connections are handed to whichever thread checks them out
+            options.setdefault('connect_args', {})['check_same_thread'] = False
+        return super().apply_driver_hacks(app, sa_url, options)
+
+db = PooledSQLAlchemy(app)
+
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers carry on while a booking holds the write lock
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(app.config['SQLITE_BUSY_TIMEOUT'])}")
+        cursor.execute(f"PRAGMA synchronous={app.config['SQLITE_SYNCHRONOUS']}")
+        cursor.execute(f"PRAGMA mmap_size={int(app.config['SQLITE_MMAP_SIZE'])}")
+        cursor.execute(f"PRAGMA cache_size={int(app.config['SQLITE_CACHE_SIZE'])}")
+        cursor.close()
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        # counts are per bucket; lines() makes them cumulative
+        i = bisect_left(self.buckets, value)
+        if i < len(self.buckets):
+            self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f'{name}_sum{{{labels}}} {self.sum}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+class RequestMetrics:
+    """Per-route latency, SQL query count and SQL time, in Prometheus text format."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+
+    def record(self, route, status, seconds, queries, sql_seconds):
+        with self.lock:
+            if route not in self.routes:
+                self.routes[route] = {
+                    'latency': Histogram(LATENCY_BUCKETS),
+                    'queries': Histogram(QUERY_COUNT_BUCKETS),
+                    'sql_seconds': 0.0,
+                    'errors': 0
+                }
+            metrics = self.routes[route]
+            metrics['latency'].observe(seconds)
+            metrics['queries'].observe(queries)
+            metrics['sql_seconds'] += sql_seconds
+            if status >= 500:
+                metrics['errors'] += 1
+
+    def render(self):
+        lines = [
+            '# HELP http_request_duration_seconds Request latency by route.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        with self.lock:
+            routes = sorted(self.routes.items())
+            for route, metrics in routes:
+                lines.extend(metrics['latency'].lines('http_request_duration_seconds', f'route="{route}"'))
+            lines += [
+                '# HELP http_request_sql_queries SQL queries issued per request by route.',
+                '# TYPE http_request_sql_queries histogram',
+            ]
+            for route, metrics in routes:
+                lines.extend(metrics['queries'].lines('http_request_sql_queries', f'route="{route}"'))
+            lines += [
+                '# HELP http_request_sql_seconds_total Time spent in SQL by route.',
+                '# TYPE http_request_sql_seconds_total counter',
+            ]
+            lines += [f'http_request_sql_seconds_total{{route="{route}"}} {metrics["sql_seconds"]}' for route, metrics in routes]
+            lines += [
+                '# HELP http_request_errors_total Requests that ended in a 5xx response by route.',
+                '# TYPE http_request_errors_total counter',
+            ]
+            lines += [f'http_request_errors_total{{route="{route}"}} {metrics["errors"]}' for route, metrics in routes]
+        return '\n'.join(lines) + '\n'
+
+request_metrics = RequestMetrics()
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def count_query(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start_time'].pop()
+    # Requests and suggestion workers set up these counters; CLI commands don't
+    if has_app_context() and 'query_count' in g:
+        g.query_count += 1
+        g.sql_seconds += elapsed
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    g.query_count = 0
+    g.sql_seconds = 0.0
+
+@app.after_request
+def record_request_status(response):
+    g.response_status = response.status_code
+    return response
+
+@app.teardown_request
+def record_request_metrics(exc):
+    if 'request_start' not in g:
+        return
+    seconds = time.perf_counter() - g.request_start
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    status = 500 if exc else g.get('response_status', 500)
+    request_metrics.record(route, status, seconds, g.query_count, g.sql_seconds)
+    if g.query_count > app.config['REQUEST_QUERY_BUDGET']:
+        app.logger.warning("%s %s issued %d SQL queries (budget %d) in %.1f ms",
+                           request.method, request.path, g.query_count,
+                           app.config['REQUEST_QUERY_BUDGET'], seconds * 1000)
 
 class MedicalHistory(db.Model):
     __bind_key__ = 'default'
+    __table_args__ = (
+        db.Index('ix_medical_history_patient_date', 'patient_id', 'date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False)
     condition = db.Column(db.String(200), nullable=False)
@@ -25,6 +246,9 @@ class MedicalHistory(db.Model):
 
 class DoctorAvailability(db.Model):
     __bind_key__ = 'doctors'
+    __table_args__ = (
+        db.Index('ix_doctor_availability_doctor_day', 'doctor_id', 'day_of_week'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     doctor_id = db.Column(db.Integer, db.ForeignKey('doctor.id'), nullable=False)
     day_of_week = db.Column(db.Integer, nullable=False)  # 0=Monday to 6=Sunday
@@ -32,6 +256,27 @@ class DoctorAvailability(db.Model):
     end_time = db.Column(db.Time, nullable=False)
     is_available = db.Column(db.Boolean, default=True)
 
+class DoctorDirectoryVersion(db.Model):
+    """Single-row counter bumped by every transaction that changes doctors,
+    their availability or exceptions; tags the doctor directory snapshot."""
+    __bind_key__ = 'doctors'
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class DoctorException(db.Model):
+    """A date on which a doctor (or, with no doctor, the whole clinic) is off:
+    all day, or between start_time and end_time."""
+    __bind_key__ = 'doctors'
+    __table_args__ = (
+        db.Index('ix_doctor_exception_date', 'date'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctor.id'))  # None for clinic holidays
+    date = db.Column(db.Date, nullable=False)
+    start_time = db.Column(db.Time)  # None for the whole day
+    end_time = db.Column(db.Time)
+    reason = db.Column(db.String(200))
+
 class Doctor(db.Model):
     __bind_key__ = 'doctors'
     id = db.Column(db.Integer, primary_key=True)
@@ -40,8 +285,14 @@ class Doctor(db.Model):
     qualification = db.Column(db.String(200))
     experience_years = db.Column(db.Integer)
     consultation_fee = db.Column(db.Float)
+    slot_minutes = db.Column(db.Integer)  # None uses DEFAULT_SLOT_MINUTES
     availability = db.relationship('DoctorAvailability', backref='doctor', lazy=True, cascade='all, delete-orphan')
 
+    @property
+    def appointments(self):
+        # Appointments live in patients.db, so this is one query rather than a cross-database join
+        return Appointment.query.filter_by(doctor_id=self.id).all()
+
 class Patient(db.Model):
     __bind_key__ = 'default'
     id = db.Column(db.Integer, primary_key=True)
@@ -54,19 +305,515 @@ class Patient(db.Model):
 
 class Appointment(db.Model):
     __bind_key__ = 'default'
+    __table_args__ = (
+        # Availability checks: doctor + date range, status read from the index
+        db.Index('ix_appointment_doctor_date', 'doctor_id', 'appointment_date', 'status'),
+        # Dashboard upcoming count: status + date range
+        db.Index('ix_appointment_status_date', 'status', 'appointment_date'),
+        # A patient's appointment list
+        db.Index('ix_appointment_patient_date', 'patient_id', 'appointment_date'),
+        # Date-range exports and archival across all doctors
+        db.Index('ix_appointment_date', 'appointment_date'),
+        # Ids are never reused, so archived appointments keep unique ids
+        {'sqlite_autoincrement': True},
+    )
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False)
     doctor_id = db.Column(db.Integer, nullable=False)
     appointment_date = db.Column(db.DateTime, nullable=False)
     reason = db.Column(db.String(200))
     status = db.Column(db.String(20), default='scheduled')  # scheduled, completed, cancelled
-    doctor = db.relationship('Doctor', backref=db.backref('appointments', lazy=True), primaryjoin="Appointment.doctor_id == Doctor.id", foreign_keys=[doctor_id])
     patient = db.relationship('Patient', backref=db.backref('appointments', lazy=True, cascade='all, delete-orphan'), lazy=True)
 
-def init_db():
+    @property
+    def doctor(self):
+        return doctor_directory.get(self.doctor_id)
+
+class ArchivedAppointment(db.Model):
+    """Completed and cancelled appointments past the retention horizon.
+
+    Rows keep their original appointment id (appointment ids are never
+    reused), so a patient's live and archived appointments page together on
+    (date, id). Scheduling never reads this table.
+    """
+    __bind_key__ = 'default'
+    __tablename__ = 'appointment_archive'
+    __table_args__ = (
+        db.Index('ix_appointment_archive_patient_date', 'patient_id', 'appointment_date'),
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False)
+    doctor_id = db.Column(db.Integer, nullable=False)
+    appointment_date = db.Column(db.DateTime, nullable=False)
+    reason = db.Column(db.String(200))
+    status = db.Column(db.String(20), nullable=False)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    patient = db.relationship('Patient', backref=db.backref('archived_appointments', lazy=True, cascade='all, delete-orphan'), lazy=True)
+
+    @property
+    def doctor(self):
+        return doctor_directory.get(self.doctor_id)
+
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+DoctorRecord = namedtuple('DoctorRecord', ['id', 'name', 'specialty', 'qualification', 'experience_years', 'consultation_fee', 'slot_minutes'])
+AvailabilityBlock = namedtuple('AvailabilityBlock', ['day_of_week', 'start_time', 'end_time'])
+CalendarException = namedtuple('CalendarException', ['doctor_id', 'date', 'start_time', 'end_time', 'reason'])
+
+def _time_or_none(value):
+    return datetime.strptime(value, '%H:%M:%S').time() if value else None
+
+def _format_time(value):
+    return value.strftime('%H:%M:%S') if value else None
+
+# Everything the directory serves, built once per load and swapped in whole,
+# so readers holding a reference never see a half-built or cleared cache
+DirectoryState = namedtuple('DirectoryState', [
+    'version',  # DoctorDirectoryVersion the data was read at
+    'doctors',  # doctor_id -> DoctorRecord
+    'by_specialty',  # specialty -> (DoctorRecord, ...)
+    'availability',  # doctor_id -> (AvailabilityBlock, ...)
+    'exceptions',  # date -> (CalendarException, ...)
+    'calendar',  # (doctor_id, date) -> ((start, end), ...), (slot_start, ...)
+    'snapshot_mtime',
+    'last_modified',
+])
+
+class DoctorDirectory:
+    """Process-wide read-through cache of the doctor roster and calendars.
+
+    Doctors are in doctors.db and appointments in patients.db, so they can't
+    be joined; appointment.doctor and the scheduling code read from here
+    instead of re-querying doctors.db. Entries are immutable records indexed
+    by doctor id and specialty.
+
+    A doctor's calendar is their weekly availability blocks (any number per
+    day), their slot length, and dated exceptions for leave and clinic
+    holidays. Each doctor-day is compiled once into working intervals and
+    slot start times, and every scheduling path reads the same table.
+
+    Committing a change to Doctor, DoctorAvailability or DoctorException
+    bumps DoctorDirectoryVersion in the same transaction and invalidates the
+    cache. Workers on one host share it through a JSON snapshot file tagged
+    with that version: invalidating removes the snapshot, every worker
+    reloads when the snapshot it loaded from is gone or replaced, and a
+    snapshot older than the database is never published or trusted.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.state = None
+        self.stale = True
+
+    def _snapshot_path(self):
+        return app.config.get('DOCTOR_DIRECTORY_SNAPSHOT')
+
+    def _snapshot_mtime(self):
+        path = self._snapshot_path()
+        try:
+            return os.stat(path).st_mtime_ns if path else None
+        except OSError:
+            return None
+
+    def invalidate(self):
+        with self.lock:
+            self.stale = True
+            path = self._snapshot_path()
+            if path:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _read_snapshot(self):
+        with open(self._snapshot_path()) as f:
+            snapshot = json.load(f)
+        doctors = [DoctorRecord(*doctor) for doctor in snapshot['doctors']]
+        availability = [
+            (doctor_id, AvailabilityBlock(day, _time_or_none(start), _time_or_none(end)))
+            for doctor_id, day, start, end in snapshot['availability']
+        ]
+        exceptions = [
+            CalendarException(doctor_id, datetime.strptime(day, '%Y-%m-%d').date(), _time_or_none(start), _time_or_none(end), reason)
+            for doctor_id, day, start, end, reason in snapshot['exceptions']
+        ]
+        return snapshot['version'], doctors, availability, exceptions
+
+    def _write_snapshot(self, version, doctors, availability, exceptions):
+        path = self._snapshot_path()
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'version': version,
+                'doctors': [list(doctor) for doctor in doctors],
+                'availability': [
+                    [doctor_id, block.day_of_week, _format_time(block.start_time), _format_time(block.end_time)]
+                    for doctor_id, block in availability
+                ],
+                'exceptions': [
+                    [exception.doctor_id, exception.date.isoformat(), _format_time(exception.start_time),
+                     _format_time(exception.end_time), exception.reason]
+                    for exception in exceptions
+                ]
+            }, f)
+        os.replace(tmp_path, path)
+
+    def _database_version(self):
+        return db.session.query(DoctorDirectoryVersion.version).scalar() or 0
+
+    def _query(self):
+        # Read the version first: a change committed during the reads below
+        # then shows up as a newer database version, never an older one
+        version = self._database_version()
+        doctors = [
+            DoctorRecord(doctor.id, doctor.name, doctor.specialty, doctor.qualification,
+                         doctor.experience_years, doctor.consultation_fee, doctor.slot_minutes)
+            for doctor in Doctor.query.order_by(Doctor.id).all()
+        ]
+        availability = [
+            (row.doctor_id, AvailabilityBlock(row.day_of_week, row.start_time, row.end_time))
+            for row in DoctorAvailability.query.filter_by(is_available=True).order_by(DoctorAvailability.id).all()
+        ]
+        exceptions = [
+            CalendarException(row.doctor_id, row.date, row.start_time, row.end_time, row.reason)
+            for row in DoctorException.query.order_by(DoctorException.date, DoctorException.id).all()
+        ]
+        return version, doctors, availability, exceptions
+
+    def _load(self):
+        """The current state, reloaded from the snapshot or the database if stale."""
+        with self.lock:
+            state = self.state
+            mtime = self._snapshot_mtime()
+            if state is not None and not self.stale and mtime == state.snapshot_mtime:
+                self.hits += 1
+                return state
+            self.misses += 1
+
+            data = None
+            if mtime is not None:
+                try:
+                    data = self._read_snapshot()
+                except (OSError, ValueError, KeyError, TypeError):
+                    pass
+                # Written by a worker that read the database before the latest change
+                if data and data[0] != self._database_version():
+                    data = None
+            self.stale = False
+            if data is None:
+                data = self._query()
+                # Publish only if no change was committed while we were reading
+                if self._database_version() != data[0]:
+                    self.stale = True
+                elif self._snapshot_path():
+                    try:
+                        self._write_snapshot(*data)
+                    except OSError as e:
+                        print("Could not write doctor directory snapshot:", str(e))
+                mtime = self._snapshot_mtime()
+
+            version, doctors, availability, exceptions = data
+            by_specialty = {}
+            for doctor in doctors:
+                by_specialty.setdefault(doctor.specialty, []).append(doctor)
+            blocks = {}
+            for doctor_id, block in availability:
+                blocks.setdefault(doctor_id, []).append(block)
+            by_date = {}
+            for exception in exceptions:
+                by_date.setdefault(exception.date, []).append(exception)
+            self.state = DirectoryState(
+                version=version,
+                doctors={doctor.id: doctor for doctor in doctors},
+                by_specialty={specialty: tuple(group) for specialty, group in by_specialty.items()},
+                availability={doctor_id: tuple(group) for doctor_id, group in blocks.items()},
+                exceptions={day: tuple(group) for day, group in by_date.items()},
+                calendar={},
+                snapshot_mtime=mtime,
+                # The snapshot's write time is the same for every worker reading it
+                last_modified=datetime.utcfromtimestamp(mtime / 1e9) if mtime else datetime.utcnow(),
+            )
+            return self.state
+
+    @property
+    def last_modified(self):
+        return self._load().last_modified
+
+    def all(self):
+        return list(self._load().doctors.values())
+
+    def get(self, doctor_id):
+        return self._get(self._load(), doctor_id)
+
+    @staticmethod
+    def _get(state, doctor_id):
+        try:
+            return state.doctors.get(int(doctor_id))
+        except (TypeError, ValueError):
+            return None
+
+    def by_specialty_of(self, specialty):
+        return self._load().by_specialty.get(specialty, ())
+
+    def blocks(self, doctor_id):
+        """All available blocks of a doctor's week, in the order they were added."""
+        return self._load().availability.get(doctor_id, ())
+
+    @classmethod
+    def _slot_length(cls, state, doctor_id):
+        doctor = cls._get(state, doctor_id)
+        return timedelta(minutes=(doctor and doctor.slot_minutes) or app.config['DEFAULT_SLOT_MINUTES'])
+
+    def slot_length(self, doctor_id):
+        return self._slot_length(self._load(), doctor_id)
+
+    def exceptions_on(self, day):
+        return self._load().exceptions.get(day, ())
+
+    def _compile_day(self, state, doctor_id, day):
+        intervals = [
+            (datetime.combine(day, block.start_time), datetime.combine(day, block.end_time))
+            for block in state.availability.get(doctor_id, ()) if block.day_of_week == day.weekday()
+        ]
+        for exception in state.exceptions.get(day, ()):
+            if exception.doctor_id not in (None, doctor_id):
+                continue
+            off_start = datetime.combine(day, exception.start_time or datetime.min.time())
+            off_end = datetime.combine(day, exception.end_time) if exception.end_time else datetime.combine(day + timedelta(days=1), datetime.min.time())
+            intervals = [
+                piece
+                for start, end in intervals
+                for piece in ((start, min(end, off_start)), (max(start, off_end), end))
+                if piece[0] < piece[1]
+            ]
+        intervals.sort()
+
+        slot = self._slot_length(state, doctor_id)
+        slots = []
+        for start, end in intervals:
+            current_time = start
+            while current_time + slot <= end:
+                slots.append(current_time)
+                current_time += slot
+        return tuple(intervals), tuple(slots)
+
+    def _calendar_day(self, doctor_id, day):
+        state = self._load()
+        key = (doctor_id, day)
+        compiled = state.calendar.get(key)
+        if compiled is None:
+            if len(state.calendar) >= app.config['CALENDAR_CACHE_DAYS']:
+                state.calendar.clear()
+            compiled = state.calendar[key] = self._compile_day(state, doctor_id, day)
+        return compiled
+
+    def day_intervals(self, doctor_id, day):
+        """(start, end) datetimes a doctor works on a date, after leave and holidays."""
+        return self._calendar_day(doctor_id, day)[0]
+
+    def day_slots(self, doctor_id, day):
+        """Start times of the doctor's slots on a date; each slot fits inside a working interval."""
+        return self._calendar_day(doctor_id, day)[1]
+
+    def stats(self):
+        state = self.state
+        return {'hits': self.hits, 'misses': self.misses, 'calendar_days': len(state.calendar) if state else 0}
+
+doctor_directory = DoctorDirectory()
+
+@event.listens_for(Session, 'before_flush')
+def track_doctor_changes(session, flush_context, instances):
+    if session.info.get('doctor_directory_stale'):
+        return
+    if any(isinstance(obj, (Doctor, DoctorAvailability, DoctorException)) for obj in (*session.new, *session.dirty, *session.deleted)):
+        session.info['doctor_directory_stale'] = True
+        # Committed or rolled back together with the change itself
+        session.execute(
+            DoctorDirectoryVersion.__table__.update().values(version=DoctorDirectoryVersion.version + 1),
+            bind_arguments={'mapper': DoctorDirectoryVersion.__mapper__}
+        )
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_doctor_directory(session):
+    if session.info.pop('doctor_directory_stale', False):
+        doctor_directory.invalidate()
+
+@event.listens_for(Session, 'after_rollback')
+def discard_doctor_changes(session):
+    session.info.pop('doctor_directory_stale', None)
+
+PATIENT_SEARCH_DDL = [
+    # Trigram index over patient names and IDs, so substring searches don't scan the table
+    "CREATE VIRTUAL TABLE IF NOT EXISTS patient_search USING fts5("
+    "name, patient_id, content='patient', content_rowid='id', tokenize='trigram')",
+    # Keep the index in sync with every insert, update and delete on patient
+    "CREATE TRIGGER IF NOT EXISTS patient_search_ai AFTER INSERT ON patient BEGIN "
+    "INSERT INTO patient_search(rowid, name, patient_id) VALUES (new.id, new.name, new.patient_id); END",
+    "CREATE TRIGGER IF NOT EXISTS patient_search_ad AFTER DELETE ON patient BEGIN "
+    "INSERT INTO patient_search(patient_search, rowid, name, patient_id) VALUES ('delete', old.id, old.name, old.patient_id); END",
+    "CREATE TRIGGER IF NOT EXISTS patient_search_au AFTER UPDATE ON patient BEGIN "
+    "INSERT INTO patient_search(patient_search, rowid, name, patient_id) VALUES ('delete', old.id, old.name, old.patient_id); "
+    "INSERT INTO patient_search(rowid, name, patient_id) VALUES (new.id, new.name, new.patient_id); END",
+    "INSERT INTO patient_search(patient_search) VALUES ('rebuild')",
+]
+
+def add_column(table, column, ddl):
+    """A migration statement adding a column unless create_all() already made it."""
+    def statement(conn):
+        if column not in [info['name'] for info in inspect(conn).get_columns(table)]:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    return statement
+
+def create_patient_search(conn):
+    """Migration statement for the trigram search index.
+
+    Skipped on other databases and on SQLite builds without FTS5 or its
+    trigram tokenizer (before 3.34); search then falls back to LIKE scans.
+    """
+    if not is_sqlite(conn):
+        return
+    try:
+        conn.execute(text(PATIENT_SEARCH_DDL[0]))
+    except OperationalError as e:
+        if 'no such tokenizer' not in str(e) and 'no such module' not in str(e):
+            raise
+        print("Patient search index not created, using LIKE search:", str(e.orig))
+        return
+    for statement in PATIENT_SEARCH_DDL[1:]:
+        conn.execute(text(statement))
+
+def make_appointment_ids_monotonic(conn):
+    """Migration statement rebuilding appointment with AUTOINCREMENT.
+
+    Plain SQLite rowids restart from max(id) + 1, so once archiving (or
+    deleting a patient) removes the newest rows, new bookings would reuse
+    ids already in appointment_archive. Server databases use sequences,
+    which never go back.
+    """
+    if not is_sqlite(conn):
+        return
+    table_sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'appointment'")).scalar()
+    if 'AUTOINCREMENT' not in table_sql.upper():
+        table = Appointment.__table__
+        columns = ', '.join(column.name for column in table.columns)
+        conn.execute(text("ALTER TABLE appointment RENAME TO appointment_old"))
+        for index in table.indexes:
+            conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+        table.create(conn)
+        conn.execute(text(f"INSERT INTO appointment ({columns}) SELECT {columns} FROM appointment_old"))
+        conn.execute(text("DROP TABLE appointment_old"))
+    # Start after every id handed out so far, including archived ones
+    conn.execute(text(
+        "INSERT INTO sqlite_sequence (name, seq) SELECT 'appointment', 0 "
+        "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'appointment')"
+    ))
+    conn.execute(text(
+        "UPDATE sqlite_sequence SET seq = max(seq, "
+        "(SELECT coalesce(max(id), 0) FROM appointment), (SELECT coalesce(max(id), 0) FROM appointment_archive)) "
+        "WHERE name = 'appointment'"
+    ))
+
+# Schema changes applied on top of create_all(), per bind. Each entry is one
+# version; the version a database is at is kept in its PRAGMA user_version
+# on SQLite, or in a schema_version table elsewhere. A statement is SQL text
+# or a callable taking the connection.
+MIGRATIONS = {
+    'default': [
+        [create_patient_search],
+        [
+            "CREATE INDEX IF NOT EXISTS ix_appointment_doctor_date ON appointment (doctor_id, appointment_date, status)",
+            "CREATE INDEX IF NOT EXISTS ix_appointment_status_date ON appointment (status, appointment_date)",
+            "CREATE INDEX IF NOT EXISTS ix_appointment_patient_date ON appointment (patient_id, appointment_date)",
+            "CREATE INDEX IF NOT EXISTS ix_medical_history_patient_date ON medical_history (patient_id, date)",
+        ],
+        [
+            "CREATE INDEX IF NOT EXISTS ix_appointment_date ON appointment (appointment_date)",
+        ],
+        [
+            make_appointment_ids_monotonic,
+        ],
+    ],
+    'doctors': [
+        [
+            "CREATE INDEX IF NOT EXISTS ix_doctor_availability_doctor_day ON doctor_availability (doctor_id, day_of_week)",
+        ],
+        [
+            add_column('doctor', 'slot_minutes', 'INTEGER'),
+        ],
+        [
+            "INSERT INTO doctor_directory_version (id, version) "
+            "SELECT 1, 0 WHERE NOT EXISTS (SELECT 1 FROM doctor_directory_version)",
+        ],
+    ],
+}
+
+def get_schema_version(conn, bind):
+    if is_sqlite(conn):
+        return conn.execute(text("PRAGMA user_version")).scalar()
+    # Both binds may share one server database, so versions are kept per bind
+    conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (bind_key VARCHAR(50) PRIMARY KEY, version INTEGER NOT NULL)"))
+    return conn.execute(text("SELECT version FROM schema_version WHERE bind_key = :bind"), {'bind': bind}).scalar() or 0
+
+def set_schema_version(conn, bind, version):
+    if is_sqlite(conn):
+        conn.execute(text(f"PRAGMA user_version = {int(version)}"))
+        return
+    conn.execute(text("DELETE FROM schema_version WHERE bind_key = :bind"), {'bind': bind})
+    conn.execute(text("INSERT INTO schema_version (bind_key, version) VALUES (:bind, :version)"), {'bind': bind, 'version': version})
+
+def migrate_bind(bind):
+    """Apply pending migrations, each version in its own transaction, so a
+    failure keeps the versions before it and is retried on the next start."""
+    engine = db.get_engine(app, bind=bind)
+    for number, statements in enumerate(MIGRATIONS[bind], start=1):
+        with engine.begin() as conn:
+            # Re-read every time: another worker may be migrating too
+            if get_schema_version(conn, bind) >= number:
+                continue
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(text(statement))
+            set_schema_version(conn, bind, number)
+
+def bootstrap_db():
+    """Create missing tables and apply pending migrations; safe to run on every start."""
+    try:
+        db.create_all()
+    except OperationalError:
+        # Another worker created the same tables first
+        db.create_all()
+
+    for bind in MIGRATIONS:
+        try:
+            migrate_bind(bind)
+        except OperationalError as e:
+            print(f"Error migrating '{bind}' database:", str(e))
+
+    # Search falls back to LIKE scans without SQLite's FTS5 trigram support
+    with db.get_engine(app, bind='default').connect() as conn:
+        app.config['PATIENT_SEARCH_FTS'] = is_sqlite(conn) and conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE name = 'patient_search'"
+        )).first() is not None
+
+def reset_db():
+    doctor_directory.invalidate()
     db.drop_all()
-    db.create_all()
-    
+    for bind in MIGRATIONS:
+        with db.get_engine(app, bind=bind).begin() as conn:
+            if bind == 'default' and is_sqlite(conn):
+                conn.execute(text("DROP TABLE IF EXISTS patient_search"))
+            set_schema_version(conn, bind, 0)
+    bootstrap_db()
+
+def seed_db():
+    if Doctor.query.first():
+        print("Doctors already present, skipping seed.")
+        return
+
     # Add initial doctors with more details
     doctors = [
         Doctor(
@@ -125,8 +872,85 @@ def init_db():
         db.session.rollback()
         print("Error initializing database:", str(e))
 
-# Initialize database with new schema and doctors
-init_db()
+@app.cli.command('seed')
+@click.option('--reset', is_flag=True, help='Drop all tables and data before seeding.')
+def seed_command(reset):
+    """Add the initial doctors and their weekly availability."""
+    if reset:
+        reset_db()
+    seed_db()
+
+# Tables the hot paths must reach through an index, never a full scan
+PLAN_CHECKED_TABLES = ('appointment', 'appointment_archive', 'doctor_availability', 'medical_history')
+
+def hot_query_paths():
+    """The scheduling and dashboard code paths whose queries must stay indexed."""
+    when = datetime.combine(datetime.utcnow().date() + timedelta(days=1), datetime.min.time().replace(hour=10))
+    doctor_ids = [doctor.id for doctor in doctor_directory.all()]
+    patient = Patient.query.first()
+    return [
+        ('check_doctor_availability', lambda: doctor_ids and check_doctor_availability(doctor_ids[0], when)),
+        ('find_next_available_slots', lambda: doctor_ids and find_next_available_slots(doctor_ids[0], when)),
+        ('find_alternative_doctors', lambda: doctor_ids and find_alternative_doctors(doctor_ids[0], when)),
+        ('compute_slot_grid', lambda: doctor_ids and compute_slot_grid(doctor_ids, when.date(), 7)),
+        ('build_day_grid', lambda: doctor_ids and build_day_grid(when)),
+        ('dashboard upcoming', lambda: DashboardStats.upcoming_query(datetime.utcnow(), when).all()),
+        ('dashboard upcoming count', lambda: DashboardStats.upcoming_count_query(when).scalar()),
+        ('patient appointments', lambda: patient and Patient.query.get(patient.id).appointments),
+        ('patient medical history', lambda: patient and Patient.query.get(patient.id).medical_history),
+        ('patient appointment window', lambda: patient and latest_appointments(patient.id)),
+    ]
+
+def explain_hot_queries():
+    """Run each hot path, EXPLAIN QUERY PLAN every statement it issues and
+    return (path, problem) pairs for plans that fully scan a checked table
+    and for paths that issued no queries at all (nothing to check, usually
+    because there are no doctors or patients yet)."""
+    engines = [db.get_engine(app, bind=bind) for bind in MIGRATIONS]
+    failures = []
+
+    for name, path in hot_query_paths():
+        captured = []
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            captured.append((conn.engine, statement, parameters))
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', capture)
+        try:
+            path()
+        finally:
+            for engine in engines:
+                event.remove(engine, 'before_cursor_execute', capture)
+        db.session.rollback()
+
+        selects = [(engine, statement, parameters) for engine, statement, parameters in captured
+                   if statement.lstrip().upper().startswith('SELECT')]
+        if not selects:
+            failures.append((name, 'issued no queries; add doctors and patients first'))
+        for engine, statement, parameters in selects:
+            with engine.connect() as conn:
+                plan = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+            for row in plan:
+                detail = row[-1]
+                if any(detail.startswith(f'SCAN {table}') for table in PLAN_CHECKED_TABLES):
+                    failures.append((name, f'full scan: {detail}'))
+                print(f"{name}: {detail}")
+
+    return failures
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Fail if any hot scheduling query degrades to a full table scan."""
+    if not all(is_sqlite(db.get_engine(app, bind=bind)) for bind in MIGRATIONS):
+        raise click.ClickException("Query plans are checked with SQLite's EXPLAIN QUERY PLAN; run this against SQLite databases")
+    failures = explain_hot_queries()
+    for name, detail in failures:
+        print(f"FAILED {name}: {detail}")
+    if failures:
+        raise SystemExit(1)
+    print("All hot queries use indexes.")
+
+# Create anything missing from the schema; never drops or seeds data
+bootstrap_db()
 
 def validate_patient_data(name, age, contact):
     errors = []
@@ -150,119 +974,412 @@ def validate_patient_data(name, age, contact):
     
     return errors
 
+@app.route('/metrics')
+def metrics():
+    directory = doctor_directory.stats()
+    cache_lines = [
+        '# HELP doctor_directory_requests_total Doctor directory lookups by result.',
+        '# TYPE doctor_directory_requests_total counter',
+        f'doctor_directory_requests_total{{result="hit"}} {directory["hits"]}',
+        f'doctor_directory_requests_total{{result="miss"}} {directory["misses"]}',
+    ]
+    return Response(request_metrics.render() + '\n'.join(cache_lines) + '\n',
+                    mimetype='text/plain; version=0.0.4')
+
+@app.route('/cache_stats')
+def cache_stats():
+    return jsonify({'doctor_directory': doctor_directory.stats()})
+
 @app.route('/get_doctor_hours/<int:doctor_id>')
 def get_doctor_hours(doctor_id):
-    doctor = Doctor.query.get_or_404(doctor_id)
+    if not doctor_directory.get(doctor_id):
+        abort(404)
     working_hours = []
-    days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
     
-    for availability in doctor.availability:
-        if availability.is_available:
-            working_hours.append({
-                'day': days[availability.day_of_week],
-                'start_time': availability.start_time.strftime('%I:%M %p'),
-                'end_time': availability.end_time.strftime('%I:%M %p')
-            })
+    for availability in doctor_directory.blocks(doctor_id):
+        working_hours.append({
+            'day': DAY_NAMES[availability.day_of_week],
+            'start_time': availability.start_time.strftime('%I:%M %p'),
+            'end_time': availability.end_time.strftime('%I:%M %p')
+        })
     
     return jsonify({'working_hours': working_hours})
 
-def check_doctor_availability(doctor_id, appointment_datetime):
-    doctor = Doctor.query.get(doctor_id)
-    if not doctor:
-        return False, "Doctor not found"
+class DoctorSchedule:
+    """A doctor's booked appointment times for a search window, checked
+    against their compiled calendar in the doctor directory.
 
-    # Check if it's within working hours
-    day_of_week = appointment_datetime.weekday()  # 0 = Monday, 6 = Sunday
-    availability = DoctorAvailability.query.filter_by(
-        doctor_id=doctor_id,
-        day_of_week=day_of_week,
-        is_available=True
-    ).first()
+    Every appointment lasts one of the doctor's slots, so two appointments
+    overlap when they start less than a slot length apart. Everything is
+    loaded up front so availability questions are answered in memory
+    instead of issuing queries per slot.
+    """
 
-    if not availability:
-        return False, "Doctor is not available on this day"
+    def __init__(self, doctor, booked):
+        self.doctor = doctor
+        self.slot = doctor_directory.slot_length(doctor.id)
+        self.booked = sorted(booked)
 
-    appointment_time = appointment_datetime.time()
-    if appointment_time < availability.start_time or appointment_time > availability.end_time:
-        return False, f"Doctor is only available between {availability.start_time.strftime('%I:%M %p')} and {availability.end_time.strftime('%I:%M %p')}"
+    @classmethod
+    def load(cls, doctor_id, window_start, window_end):
+        doctor = doctor_directory.get(doctor_id)
+        if not doctor:
+            return None
+        return cls.load_many([doctor], window_start, window_end)[doctor.id]
 
-    # Check for overlapping appointments (30-minute slots)
-    slot_start = appointment_datetime - timedelta(minutes=15)
-    slot_end = appointment_datetime + timedelta(minutes=15)
+    @classmethod
+    def load_many(cls, doctors, window_start, window_end):
+        """Schedules for several doctors from the directory and one appointments query."""
+        doctor_ids = [doctor.id for doctor in doctors]
+
+        # Widen the window by the longest slot to catch appointments overlapping its edges
+        margin = max((doctor_directory.slot_length(doctor_id) for doctor_id in doctor_ids), default=timedelta(0))
+        booked = {}
+        rows = db.session.query(Appointment.doctor_id, Appointment.appointment_date).filter(
+            Appointment.doctor_id.in_(doctor_ids),
+            Appointment.appointment_date.between(window_start - margin, window_end + margin),
+            Appointment.status != 'cancelled'
+        ).all()
+        for row in rows:
+            booked.setdefault(row.doctor_id, []).append(row.appointment_date)
 
-    overlapping_appointment = Appointment.query.filter(
-        Appointment.doctor_id == doctor_id,
-        Appointment.appointment_date.between(slot_start, slot_end),
-        Appointment.status != 'cancelled'
-    ).first()
+        return {doctor.id: cls(doctor, booked.get(doctor.id, [])) for doctor in doctors}
 
-    if overlapping_appointment:
-        patient = Patient.query.get(overlapping_appointment.patient_id)
-        return False, f"Doctor is busy with another patient at this time"
+    def booking_at(self, slot_start):
+        """Index into self.booked of the appointment overlapping the slot, or None."""
+        i = bisect_right(self.booked, slot_start - self.slot)
+        return i if i < len(self.booked) and self.booked[i] < slot_start + self.slot else None
 
-    return True, "Available"
+    def is_booked(self, slot_start):
+        return self.booking_at(slot_start) is not None
+
+    def slots(self, day):
+        return doctor_directory.day_slots(self.doctor.id, day)
+
+    def is_free(self, appointment_datetime):
+        intervals = doctor_directory.day_intervals(self.doctor.id, appointment_datetime.date())
+        if not intervals:
+            return False, "Doctor is not available on this day"
+
+        if not any(start <= appointment_datetime and appointment_datetime + self.slot <= end for start, end in intervals):
+            hours = ', '.join(f"{start.strftime('%I:%M %p')} and {end.strftime('%I:%M %p')}" for start, end in intervals)
+            return False, f"Doctor is only available between {hours}"
+
+        if self.is_booked(appointment_datetime):
+            return False, "Doctor is busy with another patient at this time"
+
+        return True, "Available"
+
+    def next_free_slots(self, requested_datetime, limit=3, days=7):
+        # On the requested day, start from the slot after the requested one
+        earliest = requested_datetime + self.slot
+        free_slots = []
+
+        for offset in range(days):
+            for slot_start in self.slots(requested_datetime.date() + timedelta(days=offset)):
+                if slot_start >= earliest and not self.is_booked(slot_start):
+                    free_slots.append(slot_start)
+                    if len(free_slots) >= limit:
+                        return free_slots
+
+        return free_slots
+
+def check_doctor_availability(doctor_id, appointment_datetime):
+    schedule = DoctorSchedule.load(doctor_id, appointment_datetime, appointment_datetime)
+    if not schedule:
+        return False, "Doctor not found"
+    return schedule.is_free(appointment_datetime)
 
 def find_next_available_slots(doctor_id, requested_datetime, limit=3):
-    doctor = Doctor.query.get(doctor_id)
-    available_slots = []
-    
     # Look for next available slots in the next 7 days
-    for days in range(7):
-        check_date = requested_datetime + timedelta(days=days)
-        day_of_week = check_date.weekday()
-        
-        # Get doctor's availability for this day
-        availability = DoctorAvailability.query.filter_by(
-            doctor_id=doctor_id,
-            day_of_week=day_of_week,
-            is_available=True
-        ).first()
-        
-        if availability:
-            # For the first day (requested day), start from the requested time
-            if days == 0:
-                start_time = max(
-                    datetime.combine(check_date.date(), availability.start_time),
-                    requested_datetime + timedelta(minutes=30)  # Start from next 30-min slot
-                )
-            else:
-                start_time = datetime.combine(check_date.date(), availability.start_time)
-            
-            end_time = datetime.combine(check_date.date(), availability.end_time)
-            
-            # Check each 30-minute slot during working hours
-            current_time = start_time
-            while current_time <= end_time:
-                is_available, _ = check_doctor_availability(doctor_id, current_time)
-                if is_available:
-                    available_slots.append(current_time)
-                    if len(available_slots) >= limit:
-                        return available_slots
-                current_time += timedelta(minutes=30)
-    
-    return available_slots
+    window_end = datetime.combine((requested_datetime + timedelta(days=6)).date(), datetime.max.time())
+    schedule = DoctorSchedule.load(doctor_id, requested_datetime, window_end)
+    if not schedule:
+        return []
+    return schedule.next_free_slots(requested_datetime, limit=limit)
+
+def find_alternative_doctors(doctor_id, appointment_datetime, window_minutes=0, rank_by='consultation_fee'):
+    """Same-specialty doctors free at the requested time, or within
+    +/- window_minutes of it, ranked by fee (cheapest first) or by
+    experience (most first)."""
+    original_doctor = doctor_directory.get(doctor_id)
+    if not original_doctor:
+        return []
+
+    doctors = [
+        doctor for doctor in doctor_directory.all()
+        if doctor.specialty == original_doctor.specialty and doctor.id != original_doctor.id
+    ]
+    if not doctors:
+        return []
+
+    window = timedelta(minutes=window_minutes)
+    schedules = DoctorSchedule.load_many(doctors, appointment_datetime - window, appointment_datetime + window)
 
-def find_alternative_doctors(doctor_id, appointment_datetime):
-    original_doctor = Doctor.query.get(doctor_id)
     alternative_doctors = []
-    
-    # Find doctors with same specialty who are available
-    doctors = Doctor.query.filter(
-        Doctor.specialty == original_doctor.specialty,
-        Doctor.id != doctor_id
-    ).all()
-    
     for doctor in doctors:
-        is_available, _ = check_doctor_availability(doctor.id, appointment_datetime)
-        if is_available:
-            alternative_doctors.append({
-                'id': doctor.id,
-                'name': doctor.name,
-                'specialty': doctor.specialty,
-                'consultation_fee': doctor.consultation_fee
-            })
-    
-    return alternative_doctors
+        # Candidate times in half-slot steps, closest to the requested time first
+        step = schedules[doctor.id].slot / 2
+        steps = int(window / step)
+        offsets = sorted((step * i for i in range(-steps, steps + 1)), key=abs)
+        for offset in offsets:
+            is_available, _ = schedules[doctor.id].is_free(appointment_datetime + offset)
+            if is_available:
+                alternative_doctors.append((abs(offset), {
+                    'id': doctor.id,
+                    'name': doctor.name,
+                    'specialty': doctor.specialty,
+                    'consultation_fee': doctor.consultation_fee,
+                    'experience_years': doctor.experience_years,
+                    'available_at': (appointment_datetime + offset).strftime("%Y-%m-%d %I:%M %p")
+                }))
+                break
+
+    if rank_by == 'experience_years':
+        rank = lambda entry: (-(entry[1]['experience_years'] or 0), entry[0])
+    else:
+        rank = lambda entry: (entry[1]['consultation_fee'] is None, entry[1]['consultation_fee'] or 0, entry[0])
+    return [doctor for _, doctor in sorted(alternative_doctors, key=rank)]
+
+# Key of the PostgreSQL advisory lock serializing appointment writers
+APPOINTMENT_LOCK_KEY = 7301
+
+def lock_appointments():
+    """Begin the session's transaction holding the appointment write lock.
+
+    On SQLite, BEGIN IMMEDIATE takes the database write lock; on PostgreSQL a
+    transaction-scoped advisory lock does the same job without blocking
+    readers. Either way it is released on commit or rollback.
+    """
+    bind_arguments = {'mapper': Appointment.__mapper__}
+    dialect = db.get_engine(app, bind=Appointment.__bind_key__).dialect.name
+    if dialect == 'sqlite':
+        db.session.execute(text("BEGIN IMMEDIATE"), bind_arguments=bind_arguments)
+    elif dialect == 'postgresql':
+        db.session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': APPOINTMENT_LOCK_KEY}, bind_arguments=bind_arguments)
+    else:
+        raise RuntimeError(f"No appointment write lock implemented for {dialect}")
+
+def book_appointments(patient_id, doctor_id, appointment_datetimes, reason):
+    """Check every requested slot and insert them all atomically, or none.
+
+    The appointment write lock is taken before the availability check, so
+    concurrent bookings can't both see a slot as free. All occurrences
+    are checked against one schedule load. Returns (appointments, conflicts):
+    conflicts maps each unavailable datetime to the reason, and nothing is
+    booked if there are any.
+    """
+    appointment_datetimes = sorted(appointment_datetimes)
+    retries = app.config['BOOKING_RETRIES']
+    for attempt in range(retries):
+        try:
+            lock_appointments()
+
+            schedule = DoctorSchedule.load(doctor_id, appointment_datetimes[0], appointment_datetimes[-1])
+            conflicts = {}
+            for i, appointment_datetime in enumerate(appointment_datetimes):
+                if not schedule:
+                    conflicts[appointment_datetime] = "Doctor not found"
+                    continue
+                is_available, message = schedule.is_free(appointment_datetime)
+                if not is_available:
+                    conflicts[appointment_datetime] = message
+                elif i and appointment_datetime - appointment_datetimes[i - 1] < schedule.slot:
+                    conflicts[appointment_datetime] = "Overlaps another appointment in this request"
+            if conflicts:
+                db.session.rollback()
+                return [], conflicts
+
+            appointments = [Appointment(
+                patient_id=patient_id,
+                doctor_id=doctor_id,
+                appointment_date=appointment_datetime,
+                reason=reason,
+                status='scheduled'
+            ) for appointment_datetime in appointment_datetimes]
+            db.session.add_all(appointments)
+            db.session.commit()
+            for appointment_datetime in appointment_datetimes:
+                dashboard_stats.appointment_added(appointment_datetime)
+            return appointments, {}
+        except OperationalError as e:
+            db.session.rollback()
+            if 'database is locked' not in str(e) or attempt == retries - 1:
+                raise
+            # Back off before retrying: 50ms, 100ms, 200ms, ...
+            time.sleep(0.05 * 2 ** attempt)
+
+def book_appointment(patient_id, doctor_id, appointment_datetime, reason):
+    """Book a single slot atomically. Returns (appointment, message);
+    appointment is None if the slot isn't available."""
+    appointments, conflicts = book_appointments(patient_id, doctor_id, [appointment_datetime], reason)
+    if conflicts:
+        return None, conflicts[appointment_datetime]
+    return appointments[0], "Appointment scheduled"
+
+MAX_SERIES_OCCURRENCES = 52
+MAX_SERIES_SPAN_DAYS = 2 * 366  # first to last occurrence
+SERIES_ALTERNATIVES_DAYS = 7  # how far past the series alternatives are searched
+
+def expand_recurrence(spec):
+    """Datetimes for a series: either an explicit 'datetimes' list, or
+    'start' with 'frequency' (daily/weekly), 'interval' and 'count'.
+    Sizes are checked before anything is built."""
+    too_many = f"A series must have between 1 and {MAX_SERIES_OCCURRENCES} occurrences"
+    if spec.get('datetimes'):
+        if not isinstance(spec['datetimes'], list):
+            raise ValueError("datetimes must be a list")
+        if len(spec['datetimes']) > MAX_SERIES_OCCURRENCES:
+            raise ValueError(too_many)
+        occurrences = [parse_series_datetime(value) for value in spec['datetimes']]
+    else:
+        count = int(spec['count'])
+        if not 1 <= count <= MAX_SERIES_OCCURRENCES:
+            raise ValueError(too_many)
+        step = {'daily': 1, 'weekly': 7}[spec.get('frequency', 'weekly')] * int(spec.get('interval', 1))
+        if step < 1:
+            raise ValueError("interval must be at least 1")
+        if step * (count - 1) > MAX_SERIES_SPAN_DAYS:
+            raise ValueError(f"A series can't span more than {MAX_SERIES_SPAN_DAYS} days")
+        start = parse_series_datetime(spec['start'])
+        try:
+            occurrences = [start + timedelta(days=step * i) for i in range(count)]
+        except OverflowError:
+            raise ValueError("A series must end before the year 10000")
+    if not occurrences:
+        raise ValueError(too_many)
+    # Alternatives are searched past the last occurrence, which must stay a valid date
+    if max(occurrences) > datetime.max - timedelta(days=SERIES_ALTERNATIVES_DAYS + 1):
+        raise ValueError("A series must end before the year 10000")
+    if max(occurrences) - min(occurrences) > timedelta(days=MAX_SERIES_SPAN_DAYS):
+        raise ValueError(f"A series can't span more than {MAX_SERIES_SPAN_DAYS} days")
+    if len(set(occurrences)) != len(occurrences):
+        raise ValueError("A series can't contain the same datetime twice")
+    return occurrences
+
+def parse_series_datetime(value):
+    # Appointment times are naive local times, so offsets can't be compared with them
+    occurrence = datetime.fromisoformat(value)
+    if occurrence.tzinfo is not None:
+        raise ValueError(f"{value}: give local times without a UTC offset")
+    return occurrence
+
+def series_alternatives(doctor_id, occurrences, conflicts, limit=3):
+    """Closest free slots after each conflicting occurrence, avoiding the
+    series' other occurrences, from one schedule load."""
+    free = [occurrence for occurrence in occurrences if occurrence not in conflicts]
+    schedule = DoctorSchedule.load(doctor_id, min(occurrences), max(occurrences) + timedelta(days=SERIES_ALTERNATIVES_DAYS))
+    if not schedule:
+        return {}
+    schedule = DoctorSchedule(schedule.doctor, schedule.booked + free)
+    return {
+        occurrence: [slot.strftime("%Y-%m-%d %I:%M %p") for slot in schedule.next_free_slots(occurrence, limit=limit)]
+        for occurrence in conflicts
+    }
+
+@app.route('/api/patients/<int:patient_id>/appointment_series', methods=['POST'])
+def book_appointment_series_api(patient_id):
+    """Book a recurring series (e.g. weekly chemo) or a list of datetimes
+    atomically: 201 with every appointment, or 409 with each conflicting
+    occurrence and its closest alternatives."""
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    if not db.session.query(Patient.id).filter_by(id=patient_id).first():
+        return jsonify({'error': 'Patient not found'}), 404
+    doctor = doctor_directory.get(data.get('doctor_id'))
+    if not doctor:
+        return jsonify({'error': 'Doctor not found'}), 404
+    try:
+        occurrences = expand_recurrence(data)
+    except (KeyError, TypeError, ValueError, OverflowError) as e:
+        return jsonify({'error': f"Invalid recurrence: {e}"}), 400
+
+    try:
+        appointments, conflicts = book_appointments(patient_id, doctor.id, occurrences, data.get('reason'))
+    except OperationalError:
+        db.session.rollback()
+        return jsonify({'error': 'Error scheduling appointments. Please try again.'}), 503
+
+    if conflicts:
+        alternatives = series_alternatives(doctor.id, occurrences, conflicts)
+        return jsonify({
+            'message': f"{len(conflicts)} of {len(occurrences)} occurrences are unavailable; nothing was booked",
+            'conflicts': [{
+                'datetime': occurrence.strftime('%Y-%m-%dT%H:%M'),
+                'message': message,
+                'alternatives': alternatives.get(occurrence, [])
+            } for occurrence, message in sorted(conflicts.items())]
+        }), 409
+    return jsonify({
+        'message': f"{len(appointments)} appointments scheduled successfully!",
+        'appointments': [serialize_appointment(appointment) for appointment in appointments]
+    }), 201
+
+# Created once here; its threads start on first use
+suggestion_executor = ThreadPoolExecutor(max_workers=app.config['SUGGESTION_WORKERS'])
+
+def _in_app_context(func, *args):
+    """Run func in its own app context and return (result, queries, SQL seconds)."""
+    with app.app_context():
+        g.query_count = 0
+        g.sql_seconds = 0.0
+        return func(*args), g.query_count, g.sql_seconds
+
+def _suggestion_result(future):
+    """A worker's result, with its SQL added to the calling request's counts."""
+    result, query_count, sql_seconds = future.result()
+    g.query_count += query_count
+    g.sql_seconds += sql_seconds
+    return result
+
+def booking_suggestions(doctor_id, appointment_datetime):
+    """Next free slots with the same doctor and alternative doctors at the
+    requested time, computed side by side on the suggestion thread pool."""
+    next_slots = suggestion_executor.submit(_in_app_context, find_next_available_slots, doctor_id, appointment_datetime)
+    alt_doctors = suggestion_executor.submit(_in_app_context, find_alternative_doctors, doctor_id, appointment_datetime)
+    return {
+        'next_available_slots': [slot.strftime("%Y-%m-%d %I:%M %p") for slot in _suggestion_result(next_slots)],
+        'alternative_doctors': _suggestion_result(alt_doctors)
+    }
+
+def serialize_appointment(appointment):
+    return {
+        'id': appointment.id,
+        'appointment_date': appointment.appointment_date.strftime('%Y-%m-%d %H:%M'),
+        'doctor_name': appointment.doctor.name if appointment.doctor else None,
+        'doctor_specialty': appointment.doctor.specialty if appointment.doctor else None,
+        'reason': appointment.reason,
+        'status': appointment.status,
+        'update_url': url_for('update_appointment_status', id=appointment.id)
+    }
+
+@app.route('/api/patients/<int:patient_id>/appointments', methods=['POST'])
+def book_appointment_api(patient_id):
+    """Book in one round trip: 201 with the appointment, or 409 with the
+    reason and ranked alternatives. Accepts JSON or form fields."""
+    data = request.get_json(silent=True) or request.form
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    if not db.session.query(Patient.id).filter_by(id=patient_id).first():
+        return jsonify({'error': 'Patient not found'}), 404
+    doctor_id = data.get('doctor_id')
+    if not doctor_directory.get(doctor_id):
+        return jsonify({'error': 'Doctor not found'}), 404
+    try:
+        appointment_datetime = datetime.strptime(f"{data.get('appointment_date')} {data.get('appointment_time')}", "%Y-%m-%d %H:%M")
+    except ValueError:
+        return jsonify({'error': 'appointment_date must be YYYY-MM-DD and appointment_time HH:MM'}), 400
+
+    try:
+        appointment, message = book_appointment(patient_id, int(doctor_id), appointment_datetime, data.get('reason'))
+    except OperationalError:
+        db.session.rollback()
+        return jsonify({'error': 'Error scheduling appointment. Please try again.'}), 503
+
+    if not appointment:
+        return jsonify(dict(message=message, **booking_suggestions(int(doctor_id), appointment_datetime))), 409
+    return jsonify({'message': 'Appointment scheduled successfully!', 'appointment': serialize_appointment(appointment)}), 201
 
 @app.route('/schedule_appointment/<int:patient_id>', methods=['POST'])
 def schedule_appointment(patient_id):
@@ -275,37 +1392,13 @@ def schedule_appointment(patient_id):
         # Combine date and time
         appointment_datetime = datetime.strptime(f"{appointment_date} {appointment_time}", "%Y-%m-%d %H:%M")
         
-        # Check if doctor is available
-        is_available, message = check_doctor_availability(doctor_id, appointment_datetime)
+        # Check availability and book in one write transaction
+        appointment, message = book_appointment(patient_id, doctor_id, appointment_datetime, reason)
         
-        if not is_available:
-            # Find next available slots for the selected doctor
-            next_slots = find_next_available_slots(doctor_id, appointment_datetime)
-            
-            # Find alternative doctors available at the requested time
-            alt_doctors = find_alternative_doctors(doctor_id, appointment_datetime)
-            
-            error_message = {
-                'message': message,
-                'next_available_slots': [slot.strftime("%Y-%m-%d %I:%M %p") for slot in next_slots],
-                'alternative_doctors': alt_doctors
-            }
-            
-            flash(error_message, 'booking_error')
+        if not appointment:
+            flash(dict(message=message, **booking_suggestions(doctor_id, appointment_datetime)), 'booking_error')
             return redirect(url_for('view_patient', id=patient_id))
 
-        # Create new appointment
-        appointment = Appointment(
-            patient_id=patient_id,
-            doctor_id=doctor_id,
-            appointment_date=appointment_datetime,
-            reason=reason,
-            status='scheduled'
-        )
-        
-        db.session.add(appointment)
-        db.session.commit()
-        
         flash('Appointment scheduled successfully!', 'success')
         return redirect(url_for('view_patient', id=patient_id))
     except Exception as e:
@@ -313,32 +1406,166 @@ def schedule_appointment(patient_id):
         flash('Error scheduling appointment. Please try again.', 'error')
         return redirect(url_for('view_patient', id=patient_id))
 
+def search_patients(search_query='', after=0, limit=None):
+    """Return one keyset page of patients ordered by id, plus the cursor for the next page.
+
+    Queries of three or more characters go through the trigram index;
+    shorter ones fall back to a LIKE scan.
+    """
+    limit = limit or app.config['PATIENTS_PAGE_SIZE']
+    query = Patient.query.filter(Patient.id > after)
+
+    if search_query and app.config.get('PATIENT_SEARCH_FTS') and len(search_query) >= 3:
+        phrase = '"' + search_query.replace('"', '""') + '"'
+        matches = db.session.execute(text(
+            "SELECT rowid FROM patient_search WHERE patient_search MATCH :phrase AND rowid > :after "
+            "ORDER BY rowid LIMIT :limit"
+        ), {'phrase': phrase, 'after': after, 'limit': limit + 1}, bind_arguments={'mapper': Patient.__mapper__})
+        query = query.filter(Patient.id.in_([row.rowid for row in matches]))
+    elif search_query:
+        query = query.filter(
+            (Patient.name.ilike(f'%{search_query}%')) |
+            (Patient.patient_id.ilike(f'%{search_query}%'))
+        )
+
+    patients = query.order_by(Patient.id).limit(limit + 1).all()
+    next_after = patients[limit - 1].id if len(patients) > limit else None
+    return patients[:limit], next_after
+
+def get_page_args():
+    after = request.args.get('after', 0, type=int)
+    per_page = request.args.get('per_page', app.config['PATIENTS_PAGE_SIZE'], type=int)
+    return after, max(1, min(per_page, app.config['PATIENTS_PAGE_SIZE'] * 10))
+
+@app.route('/search_patients')
+def search_patients_json():
+    after, per_page = get_page_args()
+    patients, next_after = search_patients(request.args.get('q', ''), after, per_page)
+    return jsonify({
+        'patients': [{
+            'id': patient.id,
+            'name': patient.name,
+            'patient_id': patient.patient_id,
+            'age': patient.age,
+            'gender': patient.gender,
+            'contact': patient.contact
+        } for patient in patients],
+        'next_after': next_after
+    })
+
+class DashboardStats:
+    """Dashboard counters, kept current by the views that change the data.
+
+    Counts are rebuilt from the database on a cold start and again once
+    STATS_CACHE_TTL expires, which also picks up writes made by other workers.
+    Upcoming appointments are an indexed count of those after the next
+    rebuild is due, plus a sorted list of the dates before it, which age out
+    without a query. Memory stays bounded by one TTL's worth of bookings.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loaded_at = None
+        self.total_patients = 0
+        self.total_appointments = 0
+        self.horizon = None  # appointments after this are counted, not listed
+        self.upcoming_after_horizon = 0
+        self.upcoming = []
+
+    def invalidate(self):
+        with self.lock:
+            self.loaded_at = None
+
+    def _is_warm(self):
+        return self.loaded_at is not None and time.monotonic() - self.loaded_at < app.config['STATS_CACHE_TTL']
+
+    def _rebuild(self):
+        now = datetime.utcnow()
+        # Nothing counted here can stop being upcoming before the next rebuild
+        self.horizon = now + timedelta(seconds=app.config['STATS_CACHE_TTL'])
+        self.total_patients = Patient.query.count()
+        self.total_appointments = Appointment.query.count() + ArchivedAppointment.query.count()
+        self.upcoming_after_horizon = self.upcoming_count_query(self.horizon).scalar()
+        self.upcoming = [row.appointment_date for row in self.upcoming_query(now, self.horizon).all()]
+        self.loaded_at = time.monotonic()
+
+    @staticmethod
+    def upcoming_count_query(after):
+        return db.session.query(func.count(Appointment.id)).filter(
+            Appointment.status == 'scheduled',
+            Appointment.appointment_date > after
+        )
+
+    @staticmethod
+    def upcoming_query(after, until):
+        return db.session.query(Appointment.appointment_date).filter(
+            Appointment.status == 'scheduled',
+            Appointment.appointment_date > after,
+            Appointment.appointment_date <= until
+        ).order_by(Appointment.appointment_date)
+
+    def get(self):
+        with self.lock:
+            if not self._is_warm():
+                self._rebuild()
+            # Drop appointments that are no longer upcoming
+            del self.upcoming[:bisect_right(self.upcoming, datetime.utcnow())]
+            return {
+                'total_patients': self.total_patients,
+                'total_appointments': self.total_appointments,
+                'upcoming_appointments': len(self.upcoming) + self.upcoming_after_horizon
+            }
+
+    def _add_upcoming(self, appointment_date):
+        if self.horizon is not None and appointment_date > self.horizon:
+            self.upcoming_after_horizon += 1
+        elif appointment_date > datetime.utcnow():
+            insort(self.upcoming, appointment_date)
+
+    def _remove_upcoming(self, appointment_date):
+        if self.horizon is not None and appointment_date > self.horizon:
+            self.upcoming_after_horizon -= 1
+            return
+        i = bisect_left(self.upcoming, appointment_date)
+        if i < len(self.upcoming) and self.upcoming[i] == appointment_date:
+            del self.upcoming[i]
+
+    def patient_added(self):
+        with self.lock:
+            self.total_patients += 1
+
+    def patient_deleted(self, appointments):
+        # appointments: (appointment_date, status) pairs removed with the patient
+        with self.lock:
+            self.total_patients -= 1
+            self.total_appointments -= len(appointments)
+            for appointment_date, status in appointments:
+                if status == 'scheduled':
+                    self._remove_upcoming(appointment_date)
+
+    def appointment_added(self, appointment_date):
+        with self.lock:
+            self.total_appointments += 1
+            self._add_upcoming(appointment_date)
+
+    def appointment_status_changed(self, appointment_date, old_status, new_status):
+        with self.lock:
+            if old_status == 'scheduled' and new_status != 'scheduled':
+                self._remove_upcoming(appointment_date)
+            elif old_status != 'scheduled' and new_status == 'scheduled':
+                self._add_upcoming(appointment_date)
+
+dashboard_stats = DashboardStats()
+
 @app.route('/')
 def index():
     search_query = request.args.get('search', '')
-    if search_query:
-        patients = Patient.query.filter(
-            (Patient.name.ilike(f'%{search_query}%')) |
-            (Patient.patient_id.ilike(f'%{search_query}%'))
-        ).all()
-    else:
-        patients = Patient.query.all()
+    after, per_page = get_page_args()
+    patients, next_after = search_patients(search_query, after, per_page)
     
-    # Calculate statistics
-    total_patients = Patient.query.count()
-    total_appointments = Appointment.query.count()
-    upcoming_appointments = Appointment.query.filter(
-        Appointment.appointment_date > datetime.utcnow(),
-        Appointment.status == 'scheduled'
-    ).count()
-    
-    stats = {
-        'total_patients': total_patients,
-        'total_appointments': total_appointments,
-        'upcoming_appointments': upcoming_appointments
-    }
+    stats = dashboard_stats.get()
     
-    return render_template('index.html', patients=patients, stats=stats)
+    return render_template('index.html', patients=patients, stats=stats, next_after=next_after)
 
 @app.route('/add_patient', methods=['POST'])
 def add_patient():
@@ -365,6 +1592,7 @@ def add_patient():
         )
         db.session.add(patient)
         db.session.commit()
+        dashboard_stats.patient_added()
         flash('Patient added successfully!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -388,18 +1616,430 @@ def add_medical_history(patient_id):
         flash('Medical history added successfully!', 'success')
     return redirect(url_for('view_patient', id=patient_id))
 
+def read_import_rows(stream, fmt):
+    """Yield (line_number, row dict) from a CSV or NDJSON text stream, one row at a time."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'ndjson':
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                row = {'_error': f"Invalid JSON: {e}"}
+            yield line_number, row if isinstance(row, dict) else {'_error': "Expected a JSON object"}
+    else:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+def _import_patient_batch(batch, report):
+    existing = {patient_id for (patient_id,) in db.session.query(Patient.patient_id).filter(
+        Patient.patient_id.in_([row['patient_id'] for row in batch])
+    ).all()}
+    mappings = []
+    for row in batch:
+        if row['patient_id'] in existing:
+            report['duplicates'] += 1
+            continue
+        existing.add(row['patient_id'])
+        mappings.append(row)
+    db.session.bulk_insert_mappings(Patient, mappings)
+    db.session.commit()
+    report['inserted'] += len(mappings)
+
+def _import_history_batch(batch, report):
+    patient_ids = dict(db.session.query(Patient.patient_id, Patient.id).filter(
+        Patient.patient_id.in_([row['patient_id'] for row in batch])
+    ).all())
+    mappings = []
+    for row in batch:
+        if row['patient_id'] not in patient_ids:
+            _add_import_error(report, row.pop('_line'), ["Unknown patient ID"])
+            continue
+        row['patient_id'] = patient_ids[row['patient_id']]
+        mappings.append(row)
+    for row in mappings:
+        row.pop('_line')
+    db.session.bulk_insert_mappings(MedicalHistory, mappings)
+    db.session.commit()
+    report['inserted'] += len(mappings)
+
+def _add_import_error(report, line_number, errors):
+    report['failed'] += 1
+    if len(report['errors']) < app.config['IMPORT_MAX_ERRORS']:
+        report['errors'].append({'line': line_number, 'errors': errors})
+
+def _import_text(row, field, label, errors):
+    """A field of an import row as a stripped string. NDJSON numbers (IDs,
+    phone numbers) are accepted; any other type is recorded as a row error."""
+    value = row.get(field)
+    if value is None:
+        return ''
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        errors.append(f"{label} must be text")
+        return ''
+    return str(value).strip()
+
+def _clean_patient_row(row):
+    errors = []
+    name = _import_text(row, 'name', "Name", errors)
+    patient_id = _import_text(row, 'patient_id', "Patient ID", errors)
+    contact = _import_text(row, 'contact', "Contact number", errors)
+    gender = _import_text(row, 'gender', "Gender", errors)
+    age = row.get('age')
+    if isinstance(age, bool) or not isinstance(age, (str, int)):
+        age = None
+    if errors:
+        return None, errors
+    errors = validate_patient_data(name, age, contact) if name else ["Name is required"]
+    if not patient_id:
+        errors.append("Patient ID is required")
+    if errors:
+        return None, errors
+    return {
+        'name': name,
+        'patient_id': patient_id,
+        'age': int(age),
+        'gender': gender or None,
+        'contact': contact
+    }, []
+
+def _clean_history_row(row):
+    errors = []
+    patient_id = _import_text(row, 'patient_id', "Patient ID", errors)
+    condition = _import_text(row, 'condition', "Condition", errors)
+    notes = _import_text(row, 'notes', "Notes", errors)
+    date = _import_text(row, 'date', "Date", errors)
+    if errors:
+        return None, errors
+    if not patient_id:
+        errors.append("Patient ID is required")
+    if not condition:
+        errors.append("Condition is required")
+    cleaned = {'patient_id': patient_id, 'condition': condition, 'notes': notes or None}
+    if date:
+        try:
+            cleaned['date'] = datetime.fromisoformat(date)
+        except ValueError:
+            errors.append("Invalid date, expected ISO format")
+    else:
+        cleaned['date'] = datetime.utcnow()
+    if errors:
+        return None, errors
+    return cleaned, []
+
+def import_records(stream, fmt, kind='patients'):
+    """Stream patients or medical history from CSV/NDJSON into the database.
+
+    Rows are validated one at a time and inserted in IMPORT_BATCH_SIZE
+    transactions, so memory use doesn't depend on the file size. Patients
+    whose patient_id already exists are skipped as duplicates; history rows
+    refer to patients by their patient_id.
+    """
+    clean_row, insert_batch = {
+        'patients': (_clean_patient_row, _import_patient_batch),
+        'medical_history': (_clean_history_row, _import_history_batch),
+    }[kind]
+    report = {'inserted': 0, 'duplicates': 0, 'failed': 0, 'errors': []}
+    batch = []
+
+    for line_number, row in read_import_rows(stream, fmt):
+        if '_error' in row:
+            _add_import_error(report, line_number, [row['_error']])
+            continue
+        cleaned, errors = clean_row(row)
+        if errors:
+            _add_import_error(report, line_number, errors)
+            continue
+        if kind == 'medical_history':
+            cleaned['_line'] = line_number
+        batch.append(cleaned)
+        if len(batch) >= app.config['IMPORT_BATCH_SIZE']:
+            insert_batch(batch, report)
+            batch = []
+
+    if batch:
+        insert_batch(batch, report)
+    dashboard_stats.invalidate()
+    return report
+
+@app.route('/import/<kind>', methods=['POST'])
+def import_endpoint(kind):
+    if kind not in ('patients', 'medical_history'):
+        return jsonify({'error': 'Unknown import type'}), 404
+    upload = request.files.get('file')
+    if not upload:
+        return jsonify({'error': 'No file uploaded'}), 400
+
+    fmt = request.form.get('format') or ('ndjson' if upload.filename.endswith(('.ndjson', '.jsonl')) else 'csv')
+    try:
+        # utf-8-sig drops the byte order mark Excel writes at the start of CSVs
+        report = import_records(io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline=''), fmt, kind)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception:
+        db.session.rollback()
+        app.logger.exception("Import of %s failed", kind)
+        return jsonify({'error': 'Import failed. Batches before the failure may already be saved.'}), 500
+    return jsonify(report)
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(['patients', 'medical_history']))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), help='Defaults to the file extension.')
+def import_command(kind, path, fmt):
+    """Bulk import patients or medical history from a CSV or NDJSON file."""
+    fmt = fmt or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+    with open(path, encoding='utf-8-sig', newline='') as stream:
+        report = import_records(stream, fmt, kind)
+    print(f"Inserted {report['inserted']}, duplicates {report['duplicates']}, failed {report['failed']}")
+    for error in report['errors']:
+        print(f"  line {error['line']}: {'; '.join(error['errors'])}")
+
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'columnar': 'application/x-ndjson',
+}
+
+def export_query(kind, date_from=None, date_to=None, doctor_id=None):
+    """Column query for an export, filtered on the indexed date and doctor columns."""
+    model, date_column = {
+        'patients': (Patient, None),
+        'appointments': (Appointment, Appointment.appointment_date),
+        'archived_appointments': (ArchivedAppointment, ArchivedAppointment.appointment_date),
+        'medical_history': (MedicalHistory, MedicalHistory.date),
+    }[kind]
+    columns = [column for column in model.__table__.columns]
+    query = db.session.query(*columns)
+
+    if date_column is not None:
+        if date_from:
+            query = query.filter(date_column >= date_from)
+        if date_to:
+            query = query.filter(date_column < date_to)
+    if kind in ('appointments', 'archived_appointments') and doctor_id:
+        query = query.filter(model.doctor_id == doctor_id)
+
+    order = date_column if date_column is not None and (date_from or date_to) else model.id
+    return [column.name for column in columns], query.order_by(order)
+
+def _export_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def export_rows(kind, fmt, date_from=None, date_to=None, doctor_id=None):
+    """Yield an export as text chunks.
+
+    Rows are fetched EXPORT_CHUNK_SIZE at a time from an open cursor, so
+    memory stays flat regardless of table size. 'columnar' writes one JSON
+    object of column arrays per chunk.
+    """
+    names, query = export_query(kind, date_from, date_to, doctor_id)
+    chunk_size = app.config['EXPORT_CHUNK_SIZE']
+    result = query.execution_options(stream_results=True).yield_per(chunk_size)
+
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(names)
+        for count, row in enumerate(result, start=1):
+            writer.writerow([_export_value(value) for value in row])
+            if count % chunk_size == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    elif fmt == 'ndjson':
+        lines = []
+        for row in result:
+            lines.append(json.dumps(dict(zip(names, map(_export_value, row)))))
+            if len(lines) >= chunk_size:
+                yield '\n'.join(lines) + '\n'
+                lines = []
+        if lines:
+            yield '\n'.join(lines) + '\n'
+    elif fmt == 'columnar':
+        chunk = []
+        for row in result:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield json.dumps({name: [_export_value(row[i]) for row in chunk] for i, name in enumerate(names)}) + '\n'
+                chunk = []
+        if chunk:
+            yield json.dumps({name: [_export_value(row[i]) for row in chunk] for i, name in enumerate(names)}) + '\n'
+    else:
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+def parse_export_date(value):
+    return datetime.strptime(value, '%Y-%m-%d') if value else None
+
+@app.route('/export/<kind>')
+def export_endpoint(kind):
+    fmt = request.args.get('format', 'csv')
+    if kind not in ('patients', 'appointments', 'archived_appointments', 'medical_history'):
+        return jsonify({'error': 'Unknown export type'}), 404
+    if fmt not in EXPORT_MIMETYPES:
+        return jsonify({'error': f'Unsupported export format: {fmt}'}), 400
+    try:
+        date_from = parse_export_date(request.args.get('from'))
+        date_to = parse_export_date(request.args.get('to'))
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+
+    extension = 'csv' if fmt == 'csv' else 'ndjson'
+    return Response(
+        stream_with_context(export_rows(kind, fmt, date_from, date_to, request.args.get('doctor_id', type=int))),
+        mimetype=EXPORT_MIMETYPES[fmt],
+        headers={'Content-Disposition': f'attachment; filename={kind}.{extension}'}
+    )
+
+@app.cli.command('export')
+@click.argument('kind', type=click.Choice(['patients', 'appointments', 'archived_appointments', 'medical_history']))
+@click.option('--format', 'fmt', type=click.Choice(list(EXPORT_MIMETYPES)), default='csv')
+@click.option('--from', 'date_from', help='First date to include (YYYY-MM-DD).')
+@click.option('--to', 'date_to', help='Date to stop before (YYYY-MM-DD).')
+@click.option('--doctor-id', type=int, help='Only appointments with this doctor.')
+@click.option('--output', '-o', type=click.File('w'), default='-')
+def export_command(kind, fmt, date_from, date_to, doctor_id, output):
+    """Stream patients, appointments (live or archived) or medical history to a file or stdout."""
+    for chunk in export_rows(kind, fmt, parse_export_date(date_from), parse_export_date(date_to), doctor_id):
+        output.write(chunk)
+
+ARCHIVED_STATUSES = ('completed', 'cancelled')
+
+def archive_appointments(before=None, batch_size=None):
+    """Move completed and cancelled appointments dated before `before`
+    (default: APPOINTMENT_RETENTION_DAYS ago) into appointment_archive.
+
+    Each batch is copied and deleted in one locked transaction, so a row is
+    in exactly one of the two tables and the live table, with its indexes,
+    only holds the active window. Returns the number of rows moved.
+    """
+    before = before or datetime.utcnow() - timedelta(days=app.config['APPOINTMENT_RETENTION_DAYS'])
+    batch_size = batch_size or app.config['ARCHIVE_BATCH_SIZE']
+    bind_arguments = {'mapper': Appointment.__mapper__}
+    columns = ['id', 'patient_id', 'doctor_id', 'appointment_date', 'reason', 'status']
+    moved = 0
+
+    while True:
+        lock_appointments()
+        ids = [row.id for row in db.session.query(Appointment.id).filter(
+            Appointment.appointment_date < before,
+            Appointment.status.in_(ARCHIVED_STATUSES)
+        ).limit(batch_size)]
+        if not ids:
+            db.session.rollback()
+            return moved
+
+        source = Appointment.__table__
+        db.session.execute(ArchivedAppointment.__table__.insert().from_select(
+            columns + ['archived_at'],
+            select([source.c[name] for name in columns] + [literal(datetime.utcnow(), db.DateTime)]).where(source.c.id.in_(ids))
+        ), bind_arguments=bind_arguments)
+        db.session.execute(source.delete().where(source.c.id.in_(ids)), bind_arguments=bind_arguments)
+        db.session.commit()
+        moved += len(ids)
+
+@app.cli.command('archive-appointments')
+@click.option('--days', type=int, help='Retention horizon in days (default APPOINTMENT_RETENTION_DAYS).')
+def archive_appointments_command(days):
+    """Move old completed and cancelled appointments out of the live table."""
+    before = datetime.utcnow() - timedelta(days=days) if days is not None else None
+    print(f"Archived {archive_appointments(before)} appointments")
+
+def window_rows(model, date_column, patient_id, before, limit):
+    """Up to limit + 1 of a patient's rows older than the (date, id) cursor, newest first."""
+    query = model.query.filter(model.patient_id == patient_id)
+    if before:
+        before_date, before_id = before
+        query = query.filter(or_(
+            date_column < before_date,
+            and_(date_column == before_date, model.id < before_id)
+        ))
+    return query.order_by(date_column.desc(), model.id.desc()).limit(limit + 1).all()
+
+def window_page(rows, date_key, limit):
+    if len(rows) <= limit:
+        return rows, None
+    last = rows[limit - 1]
+    return rows[:limit], f"{getattr(last, date_key).isoformat()},{last.id}"
+
+def latest_window(model, date_column, patient_id, before=None, limit=None):
+    """The newest rows of a patient's history or appointments, keyset-paged on (date, id).
+
+    before is the cursor returned with the previous window. Returns
+    (rows, next_cursor), where next_cursor is None once everything is loaded.
+    """
+    limit = limit or app.config['PATIENT_DETAIL_WINDOW']
+    return window_page(window_rows(model, date_column, patient_id, before, limit), date_column.key, limit)
+
+def latest_appointments(patient_id, before=None, limit=None):
+    """latest_window over a patient's live and archived appointments merged."""
+    limit = limit or app.config['PATIENT_DETAIL_WINDOW']
+    rows = [
+        row
+        for model in (Appointment, ArchivedAppointment)
+        for row in window_rows(model, model.appointment_date, patient_id, before, limit)
+    ]
+    rows.sort(key=lambda row: (row.appointment_date, row.id), reverse=True)
+    return window_page(rows[:limit + 1], 'appointment_date', limit)
+
+def parse_window_cursor(value):
+    if not value:
+        return None
+    before_date, before_id = value.rsplit(',', 1)
+    return datetime.fromisoformat(before_date), int(before_id)
+
 @app.route('/patient/<int:id>')
 def view_patient(id):
     patient = Patient.query.get_or_404(id)
-    doctors = Doctor.query.all()
-    return render_template('patient_detail.html', patient=patient, doctors=doctors)
+    history, history_cursor = latest_window(MedicalHistory, MedicalHistory.date, patient.id)
+    appointments, appointments_cursor = latest_appointments(patient.id)
+    doctors = doctor_directory.all()
+    return render_template('patient_detail.html', patient=patient, doctors=doctors,
+                           history=history, history_cursor=history_cursor,
+                           appointments=appointments, appointments_cursor=appointments_cursor)
+
+@app.route('/patient/<int:id>/medical_history')
+def patient_history_json(id):
+    try:
+        before = parse_window_cursor(request.args.get('before'))
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    history, cursor = latest_window(MedicalHistory, MedicalHistory.date, id, before)
+    return jsonify({
+        'medical_history': [{
+            'id': entry.id,
+            'date': entry.date.strftime('%Y-%m-%d %H:%M'),
+            'condition': entry.condition,
+            'notes': entry.notes
+        } for entry in history],
+        'next_cursor': cursor
+    })
+
+@app.route('/patient/<int:id>/appointments')
+def patient_appointments_json(id):
+    try:
+        before = parse_window_cursor(request.args.get('before'))
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    appointments, cursor = latest_appointments(id, before)
+    return jsonify({
+        'appointments': [serialize_appointment(appointment) for appointment in appointments],
+        'next_cursor': cursor
+    })
 
 @app.route('/delete_patient/<int:id>')
 def delete_patient(id):
     try:
         patient = Patient.query.get_or_404(id)
+        appointments = [(appointment.appointment_date, appointment.status)
+                        for appointment in (*patient.appointments, *patient.archived_appointments)]
         db.session.delete(patient)
         db.session.commit()
+        dashboard_stats.patient_deleted(appointments)
         flash('Patient deleted successfully!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -412,8 +2052,10 @@ def update_appointment_status(id):
     appointment = Appointment.query.get_or_404(id)
     status = request.form.get('status')
     if status in ['scheduled', 'completed', 'cancelled']:
+        old_status = appointment.status
         appointment.status = status
         db.session.commit()
+        dashboard_stats.appointment_status_changed(appointment.appointment_date, old_status, status)
         flash('Appointment status updated!', 'success')
     return redirect(url_for('view_patient', id=appointment.patient_id))
 
@@ -423,7 +2065,7 @@ def add_doctor():
     specialty = request.form.get('specialty')
     
     try:
-        doctor = Doctor(name=name, specialty=specialty)
+        doctor = Doctor(name=name, specialty=specialty, slot_minutes=request.form.get('slot_minutes', type=int))
         db.session.add(doctor)
         db.session.commit()
         flash('Doctor added successfully!', 'success')
@@ -433,81 +2075,193 @@ def add_doctor():
     
     return redirect(url_for('index'))
 
-@app.route('/get_available_slots', methods=['POST'])
+def parse_clock(value):
+    return datetime.strptime(value, '%H:%M').time() if value else None
+
+@app.cli.command('add-availability')
+@click.argument('doctor_id', type=int)
+@click.argument('day', type=click.Choice(DAY_NAMES, case_sensitive=False))
+@click.argument('start')
+@click.argument('end')
+def add_availability_command(doctor_id, day, start, end):
+    """Add a weekly working block (HH:MM to HH:MM); a day can have several."""
+    day_of_week = [name.lower() for name in DAY_NAMES].index(day.lower())
+    db.session.add(DoctorAvailability(doctor_id=doctor_id, day_of_week=day_of_week,
+                                      start_time=parse_clock(start), end_time=parse_clock(end), is_available=True))
+    db.session.commit()
+    print(f"Doctor {doctor_id} now works {DAY_NAMES[day_of_week]} {start}-{end}")
+
+@app.cli.command('add-exception')
+@click.argument('date', type=click.DateTime(formats=['%Y-%m-%d']))
+@click.option('--doctor-id', type=int, help='Leave for one doctor; omit for a clinic holiday.')
+@click.option('--start', help='HH:MM; omit with --end for the whole day.')
+@click.option('--end', help='HH:MM')
+@click.option('--reason', default='')
+def add_exception_command(date, doctor_id, start, end, reason):
+    """Take a doctor or the whole clinic off for all or part of a date."""
+    db.session.add(DoctorException(doctor_id=doctor_id, date=date.date(),
+                                   start_time=parse_clock(start), end_time=parse_clock(end), reason=reason))
+    db.session.commit()
+    print(f"Added exception on {date.date()} for {f'doctor {doctor_id}' if doctor_id else 'all doctors'}")
+
+@app.cli.command('set-slot-minutes')
+@click.argument('doctor_id', type=int)
+@click.argument('minutes', type=click.IntRange(5, 240), required=False)
+def set_slot_minutes_command(doctor_id, minutes):
+    """Set a doctor's appointment length, or reset it to the default."""
+    doctor = db.session.get(Doctor, doctor_id)
+    if not doctor:
+        raise click.ClickException(f"Doctor {doctor_id} not found")
+    doctor.slot_minutes = minutes
+    db.session.commit()
+    print(f"{doctor.name}: {minutes or app.config['DEFAULT_SLOT_MINUTES']}-minute slots")
+
+MAX_SLOT_GRID_DAYS = 31
+
+def compute_slot_grid(doctor_ids, start_date, days=1):
+    """Booked/free status of every slot for several doctors over a date range.
+
+    Slots come from the directory's compiled calendars and bookings from
+    one appointments query for the whole range.
+    Returns {doctor_id: {date: [(slot_start, is_booked)]}}.
+    """
+    range_start = datetime.combine(start_date, datetime.min.time())
+    range_end = range_start + timedelta(days=days)
+    schedules = DoctorSchedule.load_many([doctor_directory.get(doctor_id) for doctor_id in doctor_ids], range_start, range_end)
+
+    grid = {}
+    for doctor_id in doctor_ids:
+        schedule = schedules[doctor_id]
+        grid[doctor_id] = {}
+        for offset in range(days):
+            day = start_date + timedelta(days=offset)
+            grid[doctor_id][day] = [(slot_start, schedule.is_booked(slot_start)) for slot_start in schedule.slots(day)]
+
+    return grid
+
+def serialize_slots(day_slots):
+    return [{
+        'time': slot_start.strftime('%H:%M'),
+        'datetime': slot_start.strftime('%Y-%m-%dT%H:%M'),
+        'is_booked': is_booked
+    } for slot_start, is_booked in day_slots]
+
+@app.route('/get_available_slots', methods=['GET', 'POST'])
 def get_available_slots():
-    doctor_id = request.form.get('doctor_id')
-    date_str = request.form.get('date')
-    
+    # Accepts a single doctor_id, or doctor_ids (comma separated or repeated)
+    # together with days= to prefetch several doctors over a date range
+    doctor_ids = [value for param in request.values.getlist('doctor_ids') for value in param.split(',') if value]
+    date_str = request.values.get('date')
+
     try:
+        multi = bool(doctor_ids) or 'days' in request.values
+        if not doctor_ids:
+            doctor_ids = [request.values.get('doctor_id')]
+        doctor_ids = [int(doctor_id) for doctor_id in doctor_ids]
+        days = int(request.values.get('days', 1))
+        if days < 1 or days > MAX_SLOT_GRID_DAYS:
+            return jsonify({'error': f'days must be between 1 and {MAX_SLOT_GRID_DAYS}'}), 400
+
         # Convert date string to datetime
         selected_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-        
-        # Get all appointments for the doctor on the selected date
-        doctor = Doctor.query.get(doctor_id)
-        if not doctor:
+
+        doctor_ids = [doctor_id for doctor_id in doctor_ids if doctor_directory.get(doctor_id)]
+        if not doctor_ids:
             return jsonify({'error': 'Doctor not found'}), 404
-            
-        # Get booked appointments for the doctor on the selected date
-        booked_appointments = Appointment.query.filter(
-            Appointment.doctor_id == doctor_id,
-            db.func.date(Appointment.appointment_date) == selected_date
-        ).all()
-        
-        # Create time slots (9 AM to 5 PM, 30-minute intervals)
-        all_slots = []
-        start_time = datetime.combine(selected_date, datetime.min.time().replace(hour=9))
-        end_time = datetime.combine(selected_date, datetime.min.time().replace(hour=17))
-        
-        current_slot = start_time
-        while current_slot < end_time:
-            # Check if this slot is booked
-            slot_end = current_slot + timedelta(minutes=30)
-            is_booked = Appointment.query.filter(
-                Appointment.doctor_id == doctor_id,
-                Appointment.status == 'scheduled',
-                Appointment.appointment_date < slot_end,
-                Appointment.appointment_date + timedelta(minutes=30) > current_slot
-            ).first() is not None
-            
-            all_slots.append({
-                'time': current_slot.strftime('%H:%M'),
-                'datetime': current_slot.strftime('%Y-%m-%dT%H:%M'),
-                'is_booked': is_booked
-            })
-            
-            current_slot = slot_end
-        
-        return jsonify({'slots': all_slots})
-        
+
+        grid = compute_slot_grid(doctor_ids, selected_date, days)
+
+        if not multi:
+            return jsonify({'slots': serialize_slots(grid[doctor_ids[0]][selected_date])})
+
+        return jsonify({'doctors': [{
+            'doctor_id': doctor_id,
+            'days': [{
+                'date': day.strftime('%Y-%m-%d'),
+                'slots': serialize_slots(day_slots)
+            } for day, day_slots in grid[doctor_id].items()]
+        } for doctor_id in doctor_ids]})
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/get_doctors_by_specialty', methods=['GET'])
-def get_doctors_by_specialty():
-    specialty = request.args.get('specialty')
-    doctors = Doctor.query.filter_by(specialty=specialty).all()
-    return jsonify([{
-        'id': doc.id,
-        'name': doc.name,
-        'specialty': doc.specialty,
-        'qualification': doc.qualification,
-        'experience_years': doc.experience_years,
-        'available_days': doc.available_days.split(','),
-        'consultation_fee': doc.consultation_fee
-    } for doc in doctors])
-
-@app.route('/doctor/<int:doctor_id>')
-def get_doctor_details(doctor_id):
-    doctor = Doctor.query.get_or_404(doctor_id)
-    return jsonify({
+def doctor_details(doctor):
+    available_days = sorted({block.day_of_week for block in doctor_directory.blocks(doctor.id)})
+    return {
         'id': doctor.id,
         'name': doctor.name,
         'specialty': doctor.specialty,
         'qualification': doctor.qualification,
         'experience_years': doctor.experience_years,
-        'available_days': doctor.available_days.split(','),
+        'available_days': [DAY_NAMES[day] for day in available_days],
         'consultation_fee': doctor.consultation_fee
-    })
+    }
+
+def roster_response(payload):
+    """JSON response the booking UI can revalidate with If-None-Match/If-Modified-Since."""
+    response = jsonify(payload)
+    response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+    response.last_modified = doctor_directory.last_modified
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@app.route('/get_doctors_by_specialty', methods=['GET'])
+def get_doctors_by_specialty():
+    specialty = request.args.get('specialty')
+    return roster_response([doctor_details(doctor) for doctor in doctor_directory.by_specialty_of(specialty)])
+
+@app.route('/doctor/<int:doctor_id>')
+def get_doctor_details(doctor_id):
+    doctor = doctor_directory.get(doctor_id)
+    if not doctor:
+        abort(404)
+    return roster_response(doctor_details(doctor))
+
+def build_day_grid(selected_date):
+    """Working hours and the day's slots for every doctor.
+
+    Doctors and slots come from the directory's compiled calendars; bookings
+    come from one appointments query (joined to patients) for all doctors
+    and are matched to slots with the same overlap rule as booking.
+    """
+    doctors = doctor_directory.all()
+    doctor_ids = [doctor.id for doctor in doctors]
+    day = selected_date.date()
+    day_start = datetime.combine(day, datetime.min.time())
+    day_end = day_start + timedelta(days=1)
+    margin = max((doctor_directory.slot_length(doctor_id) for doctor_id in doctor_ids), default=timedelta(0))
+
+    bookings = db.session.query(Appointment.doctor_id, Appointment.appointment_date, Patient).join(
+        Patient, Appointment.patient_id == Patient.id
+    ).filter(
+        Appointment.doctor_id.in_(doctor_ids),
+        Appointment.status != 'cancelled',
+        Appointment.appointment_date > day_start - margin,
+        Appointment.appointment_date < day_end + margin
+    ).order_by(Appointment.appointment_date).all()
+    booked_times = {}
+    booked_patients = {}
+    for doctor_id, appointment_date, patient in bookings:
+        booked_times.setdefault(doctor_id, []).append(appointment_date)
+        booked_patients.setdefault(doctor_id, []).append(patient)
+
+    grid = []
+    for doctor in doctors:
+        entry = dict(doctor._asdict(), working_hours=doctor_directory.blocks(doctor.id), today_slots=[])
+        grid.append(entry)
+
+        # Bookings are already in date order, so indexes line up with the patients
+        schedule = DoctorSchedule(doctor, booked_times.get(doctor.id, []))
+        patients = booked_patients.get(doctor.id, [])
+        for slot_start in schedule.slots(day):
+            i = schedule.booking_at(slot_start)
+            entry['today_slots'].append({
+                'time': slot_start,
+                'is_booked': i is not None,
+                'patient': patients[i] if i is not None else None
+            })
+
+    return grid
 
 @app.route('/doctor_schedule')
 def doctor_schedule():
@@ -518,51 +2272,9 @@ def doctor_schedule():
     else:
         selected_date = datetime.now()
 
-    # Get all doctors with their availability
-    doctors = Doctor.query.all()
-    
-    # For each doctor, get their schedule for the selected date
-    for doctor in doctors:
-        # Get doctor's availability for this day
-        availability = DoctorAvailability.query.filter_by(
-            doctor_id=doctor.id,
-            day_of_week=selected_date.weekday(),
-            is_available=True
-        ).first()
-        
-        if availability and selected_date.weekday() != 6:  # If doctor works on this day and it's not Sunday
-            # Create 30-minute slots
-            slots = []
-            current_time = datetime.combine(selected_date.date(), availability.start_time)
-            end_time = datetime.combine(selected_date.date(), availability.end_time)
-            
-            while current_time < end_time:
-                # Check if this slot is booked
-                slot_end = current_time + timedelta(minutes=30)
-                appointment = Appointment.query.filter(
-                    Appointment.doctor_id == doctor.id,
-                    Appointment.status == 'scheduled',
-                    Appointment.appointment_date < slot_end,
-                    Appointment.appointment_date + timedelta(minutes=30) > current_time
-                ).first()
-                
-                # Get patient info if slot is booked
-                patient = None
-                if appointment:
-                    patient = Patient.query.get(appointment.patient_id)
-                
-                slots.append({
-                    'time': current_time,
-                    'is_booked': appointment is not None,
-                    'patient': patient
-                })
-                current_time += timedelta(minutes=30)
-            
-            doctor.today_slots = slots
-        else:
-            doctor.today_slots = []
-    
-    return render_template('doctor_schedule.html', doctors=doctors, selected_date=selected_date.strftime('%Y-%m-%d'))
+    doctors = build_day_grid(selected_date)
+
+    return render_template('doctor_schedule.html', doctors=doctors, selected_date=selected_date.strftime('%Y-%m-%d'), day_names=DAY_NAMES)
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,307 @@
+"""Load-test the scheduling endpoints against a synthetic dataset.
+
+Generates patients.db/doctors.db in --data-dir (same layout as the app) and
+records the generation parameters next to them, drives the busiest endpoints
+through the Flask test client from several threads, and writes p50/p95/p99
+latency, throughput and SQL queries per request as JSON. Each endpoint runs
+against a fresh copy of the dataset. With --baseline, exits non-zero if any
+endpoint regressed.
+
+    python benchmark.py --doctors 500 --patients 1000000 --appointments 10000000
+    python benchmark.py --baseline bench_results.json --output new_results.json
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+FIRST_NAMES = ['Asha', 'Bikram', 'Chitra', 'Deepak', 'Esha', 'Farhan', 'Gita', 'Hari', 'Ila', 'Jatin', 'Kavya', 'Lalit']
+LAST_NAMES = ['Panda', 'Sahoo', 'Dash', 'Mishra', 'Nayak', 'Behera', 'Rout', 'Mohanty', 'Das', 'Swain']
+SPECIALTIES = ['General Medicine', 'Oncology']
+STATUSES = ['scheduled'] * 6 + ['completed'] * 3 + ['cancelled']
+BATCH_SIZE = 50000
+DATASET_FILES = ('patients.db', 'doctors.db')
+DATASET_PARAMS = 'dataset.json'
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_data'))
+    parser.add_argument('--regenerate', action='store_true', help='Rebuild the dataset even if it exists.')
+    parser.add_argument('--doctors', type=int, default=50)
+    parser.add_argument('--patients', type=int, default=10000)
+    parser.add_argument('--appointments', type=int, default=100000)
+    parser.add_argument('--days', type=int, default=90, help='Appointments are spread over this many days around today.')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint.')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', help='Earlier results to compare against.')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='Allowed fractional increase in p95 latency or queries per request before failing (default 0.2).')
+    return parser.parse_args()
+
+def in_batches(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def dataset_params(args):
+    """Everything that decides what generate_dataset() writes."""
+    return {'doctors': args.doctors, 'patients': args.patients, 'appointments': args.appointments,
+            'days': args.days, 'seed': args.seed}
+
+def read_dataset_params(data_dir):
+    path = os.path.join(data_dir, DATASET_PARAMS)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def remove_dataset(data_dir):
+    for filename in os.listdir(data_dir):
+        if filename.startswith(DATASET_FILES + ('doctor_directory', DATASET_PARAMS)):
+            os.remove(os.path.join(data_dir, filename))
+
+def copy_dataset(source_dir, target_dir):
+    """Copy the database files, folding any WAL into them first."""
+    for filename in DATASET_FILES:
+        source = os.path.join(source_dir, filename)
+        conn = sqlite3.connect(source)
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.close()
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(os.path.join(target_dir, filename + suffix)):
+                os.remove(os.path.join(target_dir, filename + suffix))
+        shutil.copyfile(source, os.path.join(target_dir, filename))
+
+def close_databases(app_module):
+    """Drop pooled connections so the database files can be replaced."""
+    app_module.db.session.remove()
+    for bind in app_module.MIGRATIONS:
+        app_module.db.get_engine(app_module.app, bind=bind).dispose()
+
+def restore_dataset(app_module, data_dir, work_dir):
+    """Put a fresh copy of the dataset under the app, so writes made by one
+    scenario (bookings) don't change what the next one measures."""
+    close_databases(app_module)
+    copy_dataset(data_dir, work_dir)
+    app_module.doctor_directory.invalidate()
+    app_module.dashboard_stats.invalidate()
+
+def sql_datetime(value):
+    # Same text format SQLAlchemy uses for SQLite DateTime columns
+    return value.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+def generate_dataset(args, rng, data_dir):
+    """Bulk-load doctors, availability, patients and appointments straight through sqlite3."""
+    doctors = sqlite3.connect(os.path.join(data_dir, 'doctors.db'))
+    with doctors:
+        doctors.executemany(
+            "INSERT INTO doctor (id, name, specialty, qualification, experience_years, consultation_fee) VALUES (?, ?, ?, ?, ?, ?)",
+            [(i, f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", SPECIALTIES[i % len(SPECIALTIES)],
+              'MBBS, MD', rng.randint(1, 35), float(rng.randrange(300, 1500, 50))) for i in range(1, args.doctors + 1)]
+        )
+        doctors.executemany(
+            "INSERT INTO doctor_availability (doctor_id, day_of_week, start_time, end_time, is_available) VALUES (?, ?, ?, ?, 1)",
+            [(i, day, '09:00:00.000000', '17:00:00.000000') for i in range(1, args.doctors + 1) for day in range(6)]
+        )
+    doctors.close()
+
+    patients = sqlite3.connect(os.path.join(data_dir, 'patients.db'))
+    with patients:
+        for batch in in_batches(
+            (i, f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}{i}", f"P{i:08d}", rng.randint(1, 99),
+             rng.choice(['Male', 'Female']), str(rng.randint(10 ** 9, 10 ** 10 - 1)))
+            for i in range(1, args.patients + 1)
+        ):
+            patients.executemany("INSERT INTO patient (id, name, patient_id, age, gender, contact) VALUES (?, ?, ?, ?, ?, ?)", batch)
+
+        first_day = datetime.combine(date.today() - timedelta(days=args.days // 2), datetime.min.time())
+        for batch in in_batches(
+            (rng.randint(1, args.patients), rng.randint(1, args.doctors),
+             sql_datetime(first_day + timedelta(days=rng.randrange(args.days), hours=9, minutes=30 * rng.randrange(16))),
+             'Synthetic visit', rng.choice(STATUSES))
+            for _ in range(args.appointments)
+        ):
+            patients.executemany(
+                "INSERT INTO appointment (patient_id, doctor_id, appointment_date, reason, status) VALUES (?, ?, ?, ?, ?)", batch
+            )
+    patients.execute("ANALYZE")
+    patients.close()
+
+def scenarios(args):
+    """(name, route, expected status, request function) for each benchmarked
+    endpoint; any other status counts as an error."""
+    def random_day(rng):
+        return date.today() + timedelta(days=rng.randrange(-args.days // 2, args.days // 2))
+
+    def schedule_appointment(client, rng):
+        return client.post(f'/schedule_appointment/{rng.randint(1, args.patients)}', data={
+            'doctor_id': rng.randint(1, args.doctors),
+            'appointment_date': (date.today() + timedelta(days=rng.randrange(1, args.days // 2 or 1))).isoformat(),
+            'appointment_time': f"{rng.randint(9, 16):02d}:{rng.choice(['00', '30'])}",
+            'reason': 'Benchmark booking'
+        })
+
+    def get_available_slots(client, rng):
+        return client.post('/get_available_slots', data={'doctor_id': rng.randint(1, args.doctors), 'date': random_day(rng).isoformat()})
+
+    def doctor_schedule(client, rng):
+        return client.get(f'/doctor_schedule?date={random_day(rng).isoformat()}')
+
+    def index_search(client, rng):
+        return client.get(f'/?search={rng.choice(LAST_NAMES)}{rng.randint(1, args.patients)}')
+
+    def view_patient(client, rng):
+        return client.get(f'/patient/{rng.randint(1, args.patients)}')
+
+    return [
+        # Booked or not, the form redirects back to the patient page
+        ('schedule_appointment', '/schedule_appointment/<int:patient_id>', 302, schedule_appointment),
+        ('get_available_slots', '/get_available_slots', 200, get_available_slots),
+        ('doctor_schedule', '/doctor_schedule', 200, doctor_schedule),
+        ('index_search', '/', 200, index_search),
+        ('view_patient', '/patient/<int:id>', 200, view_patient),
+    ]
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))]
+
+def route_query_totals(app_module, route):
+    metrics = app_module.request_metrics.routes.get(route)
+    return (metrics['queries'].sum, metrics['queries'].count) if metrics else (0, 0)
+
+def run_scenario(app_module, args, name, route, expected_status, send):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    queries_before, requests_before = route_query_totals(app_module, route)
+
+    def worker(worker_id):
+        rng = random.Random(args.seed * 1000 + worker_id)
+        client = app_module.app.test_client()
+        for _ in range(args.requests // args.concurrency + (worker_id < args.requests % args.concurrency)):
+            start = time.perf_counter()
+            response = send(client, rng)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code != expected_status:
+                    errors.append(response.status_code)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(worker, range(args.concurrency)))
+    wall = time.perf_counter() - start
+
+    queries_after, requests_after = route_query_totals(app_module, route)
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'throughput_rps': round(len(latencies) / wall, 2),
+        'queries_per_request': round((queries_after - queries_before) / max(1, requests_after - requests_before), 2),
+    }
+
+def compare(results, baseline, max_regression):
+    failures = []
+    for name, current in results['endpoints'].items():
+        previous = baseline.get('endpoints', {}).get(name)
+        if not previous:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + max_regression):
+            failures.append(f"{name}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms")
+        if current['queries_per_request'] > previous['queries_per_request'] * (1 + max_regression):
+            failures.append(f"{name}: queries/request {previous['queries_per_request']} -> {current['queries_per_request']}")
+        if current['errors'] > previous['errors']:
+            failures.append(f"{name}: errors {previous['errors']} -> {current['errors']}")
+    return failures
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+    params = dataset_params(args)
+    os.makedirs(args.data_dir, exist_ok=True)
+    if args.regenerate:
+        remove_dataset(args.data_dir)
+    needs_data = not all(os.path.exists(os.path.join(args.data_dir, filename)) for filename in DATASET_FILES)
+    if needs_data:
+        remove_dataset(args.data_dir)
+    else:
+        saved = read_dataset_params(args.data_dir)
+        if saved != params:
+            generated = f"generated with {saved}" if saved else "with no record of how it was generated"
+            sys.exit(f"{args.data_dir} holds a dataset {generated}, not {params}; pass --regenerate to rebuild it")
+
+    # The app reads its database location at import time, so it is pointed
+    # at a scratch copy and --data-dir keeps the untouched dataset. The
+    # dataset is written with sqlite3, so ignore any server database URLs
+    work_dir = tempfile.mkdtemp(prefix='hospital-bench-')
+    if not needs_data:
+        copy_dataset(args.data_dir, work_dir)
+    os.environ['HOSPITAL_DATA_DIR'] = work_dir
+    for name in ('DATABASE_URL', 'DOCTORS_DATABASE_URL', 'PATIENTS_DATABASE_URL'):
+        os.environ.pop(name, None)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as app_module
+    app_module.app.logger.disabled = True
+
+    try:
+        if needs_data:
+            print(f"Generating {args.doctors} doctors, {args.patients} patients, {args.appointments} appointments...")
+            start = time.perf_counter()
+            generate_dataset(args, rng, work_dir)
+            print(f"Dataset ready in {time.perf_counter() - start:.1f}s")
+        # Keep the dataset as the app left it after creating or migrating the
+        # schema, so every restored copy is already up to date
+        close_databases(app_module)
+        copy_dataset(work_dir, args.data_dir)
+        with open(os.path.join(args.data_dir, DATASET_PARAMS), 'w') as f:
+            json.dump(params, f, indent=2)
+
+        results = {
+            'timestamp': datetime.utcnow().isoformat(),
+            'dataset': params,
+            'concurrency': args.concurrency,
+            'endpoints': {}
+        }
+        for name, route, expected_status, send in scenarios(args):
+            restore_dataset(app_module, args.data_dir, work_dir)
+            results['endpoints'][name] = run_scenario(app_module, args, name, route, expected_status, send)
+            print(f"{name:22} " + "  ".join(f"{key}={value}" for key, value in results['endpoints'][name].items()))
+        close_databases(app_module)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures = compare(results, json.load(f), args.max_regression)
+        for failure in failures:
+            print("REGRESSION", failure)
+        if failures:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""The hot scheduling, dashboard and patient queries must stay indexed.
+
+Runs every path in hot_query_paths() against throwaway SQLite databases and
+checks SQLite's EXPLAIN QUERY PLAN for full scans of the checked tables.
+"""
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+
+# app.py creates its databases on import, so point it at a scratch directory first
+for name in ('DATABASE_URL', 'DOCTORS_DATABASE_URL', 'PATIENTS_DATABASE_URL', 'HOSPITAL_SETTINGS'):
+    os.environ.pop(name, None)
+DATA_DIR = os.environ['HOSPITAL_DATA_DIR'] = tempfile.mkdtemp(prefix='hospital-plans-')
+
+import app as hospital
+from app import Appointment, ArchivedAppointment, MedicalHistory, Patient, db
+
+
+def assert_scratch_databases():
+    """The fixtures drop every table, so refuse to touch anything but the scratch files."""
+    for bind, url in hospital.app.config['SQLALCHEMY_BINDS'].items():
+        engine = db.get_engine(hospital.app, bind=bind)
+        assert engine.dialect.name == 'sqlite' and engine.url.database, f"{bind} bind is not a SQLite file: {url}"
+        path = os.path.realpath(engine.url.database)
+        assert os.path.commonpath([path, os.path.realpath(DATA_DIR)]) == os.path.realpath(DATA_DIR), \
+            f"{bind} bind points outside {DATA_DIR}: {url}"
+
+
+@pytest.fixture
+def empty_db():
+    with hospital.app.app_context():
+        assert_scratch_databases()
+        hospital.reset_db()
+        yield
+
+
+@pytest.fixture
+def seeded_db(empty_db):
+    hospital.seed_db()
+    doctor_ids = [doctor.id for doctor in hospital.doctor_directory.all()]
+    now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+
+    for number in range(50):
+        patient = Patient(name=f'Test Patient{number}', patient_id=f'P{number:04d}',
+                          age=30, gender='F', contact='9000000000')
+        db.session.add(patient)
+        db.session.flush()
+        db.session.add(MedicalHistory(patient_id=patient.id, condition='Checkup', date=now - timedelta(days=number)))
+        for offset in (-400, -3, 1, 2):
+            db.session.add(Appointment(patient_id=patient.id, doctor_id=doctor_ids[number % len(doctor_ids)],
+                                       appointment_date=now + timedelta(days=offset, hours=number % 8),
+                                       status='scheduled' if offset > 0 else 'completed'))
+    db.session.commit()
+    assert hospital.archive_appointments() > 0
+    assert ArchivedAppointment.query.count() > 0
+    yield
+
+
+def test_hot_queries_use_indexes(seeded_db):
+    assert hospital.explain_hot_queries() == []
+
+
+def test_empty_database_has_nothing_to_check(empty_db):
+    failures = hospital.explain_hot_queries()
+    assert {name for name, detail in failures} >= {'check_doctor_availability', 'patient appointment window'}
+    assert all('issued no queries' in detail for name, detail in failures)
+
+
+def test_check_query_plans_command(seeded_db):
+    result = hospital.app.test_cli_runner().invoke(args=['check-query-plans'])
+    assert result.exit_code == 0, result.output
+    assert 'All hot queries use indexes.' in result.output
+
+
+def test_check_query_plans_command_fails_without_data(empty_db):
+    result = hospital.app.test_cli_runner().invoke(args=['check-query-plans'])
+    assert result.exit_code != 0
+    assert 'issued no queries' in result.output